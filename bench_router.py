@@ -0,0 +1,106 @@
+"""
+Throughput and accuracy of query_router.KeywordRouter against the substring cascade
+detect_query_type used before, on a small labelled corpus of routing decisions.
+With --embed-model, also query_router.SemanticRouter using that Ollama model.
+
+    python bench_router.py [--repeat 2000] [--embed-model nomic-embed-text]
+"""
+import argparse
+import timeit
+
+from query_router import KeywordRouter, OllamaEmbedder, SemanticRouter
+
+# "chat" means no route should match, so detect_query_type alternates haiku/llama
+CORPUS = [
+    ("read the database password from vault", "secrets"),
+    ("store a new api key for the payments service in openbao", "secrets"),
+    ("rotate the tls certificate for the keycloak host", "secrets"),
+    ("list the secrets under /kv/app", "secrets"),
+    ("my keyboard shortcuts stopped working", "chat"),
+    ("what's a good monkey name for a pet", "chat"),
+    ("list open merge requests", "gitlab"),
+    ("show me the open issues in the repo", "gitlab"),
+    ("which commits landed on the release branch today", "gitlab"),
+    ("why did the gitlab pipeline fail on main", "gitlab"),
+    ("list open mr", "gitlab"),
+    ("tell me about mrs dalloway", "chat"),
+    ("show the docker logs for the synapse container", "chat_llama"),
+    ("why is my container running out of memory", "chat_llama"),
+    ("scale the kubernetes deployment to three pods", "chat_llama"),
+    ("which volumes is the postgres container using", "chat_llama"),
+    ("is the nginx server on aws healthy", "chat_llama"),
+    ("write a python function that parses a date", "code"),
+    ("fix the syntax error in this javascript", "code"),
+    ("explain this sorting algorithm", "code"),
+    ("how do I compile this c++ program", "code"),
+    ("refactor the java class to use generics", "code"),
+    ("what's the weather like in paris", "chat"),
+    ("tell me a joke about penguins", "chat"),
+    ("summarize the french revolution", "chat"),
+    ("recommend a good book on history", "chat"),
+    ("the pods keep crashing after the deployment", "chat_llama"),
+    ("show the containers that restarted in the last hour", "chat_llama"),
+    ("debug this python function that throws an error", "code"),
+    ("who has access to the vault credentials", "secrets"),
+    ("the monkeypatch in my tests breaks the import", "chat"),
+    ("why is my container OOMing", "chat_llama"),
+    ("write a function that parses container logs", "code"),
+    ("add a docker healthcheck to this compose service definition", "code"),
+    ("write a script that lists the kubernetes pods", "code"),
+    ("open an issue about the failing pipeline", "gitlab"),
+]
+
+
+def legacy_route(content):
+    """detect_query_type's keyword cascade before KeywordRouter."""
+    content = content.lower()
+    routes = [
+        ("secrets", ["secret", "vault", "credential", "password", "token", "key",
+                     "certificate", "cert", "openbao", "bao", "kv"]),
+        ("gitlab", ["gitlab", "merge request", "mr", "pipeline", "ci/cd",
+                    "issue", "repository", "repo", "commit", "branch"]),
+        ("chat_llama", ["docker", "kubernetes", "k8s", "logs", "monitoring", "deployment",
+                        "container", "pod", "service", "cluster", "node", "volume",
+                        "namespace", "config", "configuration", "system", "environment",
+                        "infrastructure", "server", "cloud", "aws", "azure", "gcp"]),
+        ("code", ["code", "function", "programming", "debug", "error",
+                  "python", "javascript", "java", "cpp", "c++",
+                  "algorithm", "compile", "syntax", "git", "github"]),
+    ]
+    for route, keywords in routes:
+        if any(keyword in content for keyword in keywords):
+            return route
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--embed-model", help="Ollama embedding model for SemanticRouter")
+    args = parser.parse_args()
+
+    router = KeywordRouter()
+    queries = [query for query, _ in CORPUS]
+    routers = [("legacy", legacy_route, args.repeat), ("keyword router", router.route, args.repeat)]
+    if args.embed_model:
+        semantic = SemanticRouter(router, embed=OllamaEmbedder(model=args.embed_model))
+        semantic.similarities("warm up")  # embed the examples outside the timing
+        # The first pass embeds, later ones hit the LRU cache
+        routers.append(("semantic router (cold)", semantic.route, 1))
+        routers.append(("semantic router (cached)", semantic.route, args.repeat))
+    for name, route, repeat in routers:
+        seconds = timeit.timeit(lambda: [route(q) for q in queries], number=repeat)
+        rate = len(queries) * repeat / seconds
+        misses = [
+            (query, expected, route(query) or "chat")
+            for query, expected in CORPUS
+            if (route(query) or "chat") != expected
+        ]
+        accuracy = 1 - len(misses) / len(CORPUS)
+        print(f"{name}: {rate:,.0f} routes/s ({1e6 / rate:.1f}us each), accuracy {accuracy:.0%}")
+        for query, expected, got in misses:
+            print(f"    {query!r}: expected {expected}, got {got}")
+
+
+if __name__ == "__main__":
+    main()
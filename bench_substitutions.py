@@ -0,0 +1,87 @@
+"""
+Compare the old per-variable str.replace loop with util's compiled single-pass
+substitution on the real nginx and Synapse templates.
+
+The namespace is synthetic (env.py needs Docker, GPUs and editme.py), but sized like
+the real one: every name the templates use, prefix variants of those names, and
+filler names up to --names in total.
+
+    python bench_substitutions.py [--names 400] [--repeat 200]
+"""
+import argparse
+import os
+import re
+import timeit
+
+import util
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+TEMPLATES = [
+    os.path.join(here, "nginx", "nginx.conf.template"),
+    os.path.join(here, "synapse", "homeserver.yaml.template"),
+]
+
+
+def legacy_render(text, env_vars):
+    """The loop util.substitutions used before the compiled engine."""
+    for k, v in env_vars.items():
+        text = text.replace("$" + k, str(v))
+    return text
+
+
+def compiled_render(text, pattern, env_vars):
+    return util._render(text, pattern, env_vars, set())
+
+
+def synthetic_namespace(texts, size):
+    names = set()
+    for text in texts:
+        # upper-case only, so nginx's own $host, $uri, ... stay untouched
+        names.update(re.findall(r"\$([A-Z][A-Z0-9_]*)", text))
+    env_vars = {}
+    # Shorter prefixes first, like env.py's KEYCLOAK_HOST before KEYCLOAK_HOST_..., so
+    # the legacy loop shows its order-dependent prefix collisions
+    for name in sorted(names, key=len):
+        env_vars[name[: max(3, len(name) // 2)]] = "PREFIX"
+        env_vars[name] = f"value-of-{name.lower()}"
+    i = 0
+    while len(env_vars) < size:
+        env_vars[f"FILLER_SETTING_{i}"] = f"filler-{i}"
+        i += 1
+    return env_vars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--names", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    texts = {}
+    for path in TEMPLATES:
+        with open(path, "r") as f:
+            texts[os.path.relpath(path, here)] = f.read()
+    env_vars = synthetic_namespace(texts.values(), args.names)
+
+    compile_time = timeit.timeit(lambda: util.compile_substitutions(env_vars), number=20) / 20
+    pattern = util.compile_substitutions(env_vars)
+    print(f"{len(env_vars)} names, pattern compiled in {compile_time * 1000:.2f}ms")
+
+    for name, text in texts.items():
+        legacy = timeit.timeit(lambda: legacy_render(text, env_vars), number=args.repeat)
+        compiled = timeit.timeit(
+            lambda: compiled_render(text, pattern, env_vars), number=args.repeat
+        )
+        same = legacy_render(text, env_vars) == compiled_render(text, pattern, env_vars)
+        print(
+            f"{name} ({len(text) // 1024}KB): "
+            f"legacy {legacy / args.repeat * 1000:.3f}ms, "
+            f"compiled {compiled / args.repeat * 1000:.3f}ms, "
+            f"{legacy / compiled:.1f}x, "
+            f"{'same output' if same else 'outputs differ (legacy prefix collisions)'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
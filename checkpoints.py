@@ -0,0 +1,108 @@
+import getpass
+import os
+import sqlite3
+import time
+import uuid
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+CHECKPOINT_DB = os.path.join(here, "checkpoints.sqlite")
+STORE_DB = os.path.join(here, "store.sqlite")
+
+# Checkpoints kept per thread; only the latest is needed to resume a conversation
+KEEP_CHECKPOINTS = int(os.environ.get("KEEP_CHECKPOINTS", 10))
+# Threads idle this long are dropped entirely
+MAX_THREAD_AGE_DAYS = float(os.environ.get("MAX_THREAD_AGE_DAYS", 30))
+
+# 100ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+_THREAD_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "threads.devsecops")
+
+
+def thread_id_for(user: str = None) -> str:
+    """A stable thread ID per user, so a user's conversation resumes across restarts."""
+    return str(uuid.uuid5(_THREAD_NAMESPACE, user or getpass.getuser()))
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """Unix time a checkpoint was written, from its UUIDv6 ID."""
+    value = uuid.UUID(checkpoint_id).int
+    ticks = ((value >> 96) << 28) | (((value >> 80) & 0xFFFF) << 12) | ((value >> 64) & 0x0FFF)
+    return (ticks - _UUID_EPOCH_OFFSET) / 1e7
+
+
+def _connect(path: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def open_checkpointer(path: str = CHECKPOINT_DB):
+    """SqliteSaver for the CLI (the server uses AsyncSqliteSaver on the same file)."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    return SqliteSaver(_connect(path))
+
+
+def open_store(path: str = STORE_DB):
+    """SqliteStore when this langgraph has one, otherwise an in-memory store."""
+    try:
+        from langgraph.store.sqlite import SqliteStore
+    except ImportError:
+        from langgraph.store.memory import InMemoryStore
+
+        return InMemoryStore()
+    # SqliteStore manages its own transactions
+    store = SqliteStore(_connect(path, isolation_level=None))
+    store.setup()
+    return store
+
+
+def compact(path: str = CHECKPOINT_DB, keep: int = KEEP_CHECKPOINTS, max_age_days: float = MAX_THREAD_AGE_DAYS):
+    """
+    Keep only the latest `keep` checkpoints of each thread and drop threads whose last
+    checkpoint is older than max_age_days, along with their pending writes. Safe while
+    the graph is running: every kept checkpoint stores its channel values in full.
+    """
+    if not os.path.exists(path):
+        return dict(checkpoints=0, writes=0, threads=0)
+    conn = _connect(path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'checkpoints'").fetchone():
+            return dict(checkpoints=0, writes=0, threads=0)
+        cutoff = time.time() - max_age_days * 86400
+        with conn:
+            stale = [
+                (thread_id,)
+                for thread_id, latest in conn.execute(
+                    "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+                )
+                if checkpoint_time(latest) < cutoff
+            ]
+            conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+            deleted = conn.execute(
+                """DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS newest
+                        FROM checkpoints
+                    ) WHERE newest > ?
+                )""",
+                (keep,),
+            ).rowcount
+            writes = conn.execute(
+                """DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns
+                    AND c.checkpoint_id = writes.checkpoint_id
+                )"""
+            ).rowcount
+        return dict(checkpoints=deleted, writes=writes, threads=len(stale))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(compact())
@@ -0,0 +1,149 @@
+import os
+from typing import Callable, Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from streaming import message_text
+
+# Prompt tokens each route's model may be sent: history beyond this is summarized
+TOKEN_BUDGETS: Dict[str, int] = {
+    "chat_haiku": 6000,
+    "chat_llama": 3000,
+    "code": 6000,
+    "gitlab": 2000,
+    "secrets": 2000,
+}
+DEFAULT_BUDGET = 3000
+# Turns (a user message and everything answering it) always kept verbatim
+KEEP_TURNS = int(os.environ.get("KEEP_TURNS", 4))
+# Characters of a message always kept when even the recent turns are over budget
+MIN_KEEP_CHARS = 1000
+
+SUMMARY_PROMPT = """Fold the new conversation lines into the running summary of a conversation
+between a user and a DevSecOps assistant. Keep names, hosts, containers, file paths,
+decisions and open questions; drop pleasantries. Reply with the updated summary only.
+
+Running summary:
+{summary}
+
+New lines:
+{lines}"""
+
+
+def estimate_tokens(messages) -> int:
+    """About four characters per token: close enough to budget with, and free."""
+    return sum(len(message_text(message)) for message in messages) // 4 + 4 * len(messages)
+
+
+def split_turns(messages: List, keep_turns: int = KEEP_TURNS):
+    """(older, recent): recent starts at the keep_turns-th last user message."""
+    starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if len(starts) <= keep_turns:
+        return [], messages
+    cut = starts[-keep_turns] if keep_turns else len(messages)
+    return messages[:cut], messages[cut:]
+
+
+def truncate_to_budget(messages: List, budget: int, min_keep_chars: int = MIN_KEEP_CHARS) -> List:
+    """
+    Copies (same IDs, so they replace the originals in state) of the messages that have
+    to be cut for messages to fit budget. The largest go first and the newest message
+    last, so the question being answered survives when anything else can give. Each
+    keeps its head and tail, where commands, errors and conclusions usually are.
+    """
+    excess = estimate_tokens(messages) - budget
+    if excess <= 0:
+        return []
+    candidates = sorted(messages[:-1], key=lambda message: len(message_text(message)), reverse=True)
+    truncated = []
+    for message in candidates + messages[-1:]:
+        text = message_text(message)
+        # Cut a little extra for the marker that replaces the text
+        cut = min(len(text) - min_keep_chars, excess * 4 + 100)
+        if cut <= 0:
+            continue
+        keep = len(text) - cut
+        content = (
+            text[: keep // 2]
+            + f"\n[... {cut} characters trimmed to fit the context budget ...]\n"
+            + text[len(text) - (keep - keep // 2):]
+        )
+        truncated.append(message.model_copy(update={"content": content}))
+        excess -= (len(text) - len(content)) // 4
+        if excess <= 0:
+            break
+    return truncated
+
+
+def context_messages(state, keep_turns: int = KEEP_TURNS) -> List:
+    """The summary and earlier recent turns, for a node to send ahead of the new message."""
+    context = []
+    if state.get("summary"):
+        context.append(SystemMessage(content="Summary of the conversation so far:\n" + state["summary"]))
+    _, recent = split_turns(state["messages"][:-1], keep_turns)
+    context += [
+        message for message in recent
+        if isinstance(message, (HumanMessage, AIMessage)) and message_text(message)
+    ]
+    return context
+
+
+class ContextManager:
+    """
+    First node of the graph: once the thread's messages exceed the budget of the model
+    they're about to be routed to, fold all but the last keep_turns turns into the
+    thread's rolling summary (kept in state, so it's checkpointed per thread) and
+    remove them from the state. If the recent turns alone are still over budget
+    (large tool output, pasted code), their largest messages are truncated in place.
+    """
+
+    def __init__(
+        self,
+        summarizer,
+        route: Callable[[dict], str],
+        budgets: Dict[str, int] = TOKEN_BUDGETS,
+        keep_turns: int = KEEP_TURNS,
+    ):
+        self.summarizer = summarizer
+        self.route = route
+        self.budgets = budgets
+        self.keep_turns = keep_turns
+
+    def summarize(self, summary: str, messages) -> str:
+        lines = "\n".join(
+            f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message_text(message)}"
+            for message in messages
+            if isinstance(message, (HumanMessage, AIMessage)) and message_text(message)
+        )
+        if not lines:
+            return summary
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(empty)", lines=lines)
+        # Tagged so the summary isn't streamed to the user as if it were the answer
+        response = self.summarizer.invoke([HumanMessage(content=prompt)], config={"tags": [TAG_NOSTREAM]})
+        return message_text(response).strip()
+
+    def process_state(self, state) -> dict:
+        messages = state["messages"]
+        summary = state.get("summary", "")
+        budget = self.budgets.get(self.route(state), DEFAULT_BUDGET)
+        if estimate_tokens(messages) + len(summary) // 4 <= budget:
+            return {}
+        older, recent = split_turns(messages, self.keep_turns)
+        update = {}
+        if older:
+            try:
+                summary = self.summarize(summary, older)
+            except Exception as ex:
+                # Still trim: an unbounded history is worse than a stale summary
+                print(f"Error summarizing conversation: {str(ex)}")
+            print(f"Folded {len(older)} messages into the conversation summary")
+            update = {
+                "summary": summary,
+                "messages": [RemoveMessage(id=message.id) for message in older],
+            }
+        truncated = truncate_to_budget(recent, budget - len(summary) // 4)
+        if truncated:
+            print(f"Truncated {len(truncated)} recent messages to fit the context budget")
+            update["messages"] = update.get("messages", []) + truncated
+        return update
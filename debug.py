@@ -19,9 +19,8 @@ import env
 print("Applying env var substitutions in hard-coded .template files")
 util.substitutions(here, env)
 
-# Convert env.py to a dictionary
-config = vars(env)
-dockerConfig = config[container_name]
+# Look the config up by attribute so lazily defined configs get built
+dockerConfig = getattr(env, container_name)
 
 # make sure the network is up
 utils_docker.ensure_network(env.BRAND_NAME)
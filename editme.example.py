@@ -25,7 +25,17 @@ SERVICES_TO_RUN = [
     "webapp_build",# Social Media - Our Client Production Build
 ]
 
+MODEL_CACHE_BUDGET_GB = None  # Cap on ollama/whisper/huggingface model stores, e.g. 200
+MODEL_CACHE_MIN_FREE_GB = None  # Evict unused models before pulling if free disk drops below this, e.g. 20
+WHISPER_MODELS = []  # Whisper models to keep out of eviction, e.g. ["large-v3.pt"]
+
+GPU_PLACEMENT = {"sglang": "dedicated", "ollama": "shared", "deepseek_janus": "shared"}  # "dedicated" gets its own GPU when there are enough
+KEYCLOAK_REPLICAS = 1  # Clustered Keycloak containers behind nginx
+SYNAPSE_WORKERS = 0  # Generic Synapse workers to run alongside the main process. 0 = single process
+
 distinguisher = ""  # If you are running multiple deployments on the same machine, you can distinguish them here
+DENSITY_MODE = False  # Namespace this deployment by distinguisher and serve it through a shared edge nginx
+SHARED_ASSETS_DIR = "~/.cache/devsecops"  # Model stores and package caches shared between deployments
 KEYCLOAK_PORT = ""  # if applicable
 KEYCLOAK_INTERNAL_URL = "keycloak." + BACKEND_LOCATION
 SYNAPSE_CLIENT_SECRET = "changeme"
@@ -2,10 +2,11 @@ from editme import *
 
 # The remainder of the environment can be generated
 import os
-import requests
+import sys
 import json
 import copy
 import util
+import utils_synapse
 
 # Get the current user's UID and GID
 uid = os.getuid()
@@ -23,27 +24,113 @@ keys_dir = os.path.join(certs_dir, "keys")
 synapse_dir = os.path.join(current_dir, "synapse")
 bsky_bridge_dir = os.path.join(current_dir, "bsky_bridge")
 gitea_dir = os.path.join(current_dir, "gitea")
-# Check to see if we're in an EC2 instance
-ec2_metadata_base_url = "http://169.254.169.254/latest/meta-data/"
-try:
-    response = requests.get(ec2_metadata_base_url, timeout=1)
-    response.raise_for_status()
-    metadata_keys = response.text.splitlines()
-
-    metadata = {}
-    for key in metadata_keys:
-        key_url = ec2_metadata_base_url + key
-        key_response = requests.get(key_url, timeout=1)
-        key_response.raise_for_status()
-        metadata[key] = key_response.text
 
+# Density mode runs many deployments on one host, one per distinguisher. Containers
+# and volumes get the distinguisher appended (keeping their short names as network
+# aliases), host ports are dropped in favour of a shared SNI-routing edge nginx
+# (utils_edge.py), and model stores and package caches live under SHARED_ASSETS_DIR.
+DENSITY_MODE = globals().get("DENSITY_MODE", False)
+SHARED_ASSETS_DIR = os.path.expanduser(
+    globals().get("SHARED_ASSETS_DIR", "~/.cache/devsecops")
+)
+if DENSITY_MODE and not distinguisher:
+    raise ValueError("DENSITY_MODE needs a distinguisher unique to this deployment")
+assets_dir = SHARED_ASSETS_DIR if DENSITY_MODE else current_dir
+
+ollama_models_dir = os.path.join(assets_dir, "ollama", "ollama_models")
+whisper_models_dir = os.path.join(assets_dir, "ollama", "whisper_models")
+huggingface_dir = os.path.join(assets_dir, "huggingface")
+npm_cache_dir = os.path.join(SHARED_ASSETS_DIR, "npm")
+
+# Attributes that are slow to work out (host probes, key generation) are defined
+# lazily: the factory registered with @_lazy runs on first access through the
+# module's __getattr__, so `import env` for a URL or two stays fast. Host facts the
+# factories need are remembered in FACTS_FILE; `python run.py refresh` re-probes them.
+LAZY_ATTRIBUTES = {}
+FACTS_FILE = os.path.join(current_dir, "env_facts.json")
+_facts = None
+
+
+def _lazy(name):
+    def register(factory):
+        LAZY_ATTRIBUTES[name] = factory
+        return factory
+
+    return register
+
+
+def __getattr__(name):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = LAZY_ATTRIBUTES[name]()
+    if DENSITY_MODE and isinstance(value, dict) and "image" in value:
+        _apply_density(value)
+    globals()[name] = value
+    return value
+
+
+def _save_facts():
+    with open(FACTS_FILE + ".tmp", "w") as f:
+        json.dump(_facts, f, indent=2, sort_keys=True)
+    os.replace(FACTS_FILE + ".tmp", FACTS_FILE)
+
+
+def _fact(name, probe):
+    """A host fact, probed once and then read from FACTS_FILE."""
+    global _facts
+    if _facts is None:
+        try:
+            with open(FACTS_FILE, "r") as f:
+                _facts = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _facts = {}
+    if name not in _facts:
+        _facts[name] = probe()
+        _save_facts()
+    return _facts[name]
+
+
+def _probe_ec2():
+    """EC2 instance metadata, or None when not running on EC2."""
+    import utils_ec2
+
+    metadata = utils_ec2.load_metadata()
+    if metadata is None:
+        print("No EC2 Metadata. Assuming local deployment")
+        return None
     print(json.dumps(metadata))
-    IS_EC2 = True
     print("Detected EC2 Runtime")
+    return metadata
+
+
+def _probe_gpus():
+    """Index, UUID, name and memory of every GPU on this host."""
+    import utils_hardware
+
+    return utils_hardware.query_gpus()
+
+
+FACT_PROBES = {"ec2_metadata": _probe_ec2, "gpus": _probe_gpus}
+
+
+def refresh_facts():
+    """Probe every host fact again and forget the lazy attributes built from the old ones."""
+    global _facts
+    _facts = {name: probe() for name, probe in FACT_PROBES.items()}
+    _save_facts()
+    for name in LAZY_ATTRIBUTES:
+        globals().pop(name, None)
+    return _facts
+
+
+@_lazy("EC2_METADATA")
+def _ec2_metadata():
+    return _fact("ec2_metadata", _probe_ec2)
 
-except requests.RequestException as e:
-    print("No EC2 Metadata. Assuming local deployment")
-    IS_EC2 = False
+
+@_lazy("IS_EC2")
+def _is_ec2():
+    return _fact("ec2_metadata", _probe_ec2) is not None
 
 
 MODELS_TO_PULL = [
@@ -53,6 +140,13 @@ MODELS_TO_PULL = [
     "deepseek-coder:6.7b",  # "omercelik/mistral-small-coder
 ]
 
+# Whisper models (file or directory names under whisper_models_dir) kept out of eviction
+WHISPER_MODELS = globals().get("WHISPER_MODELS", [])
+
+# Model store disk budget (see utils_models.py). None disables either check.
+MODEL_CACHE_BUDGET_GB = globals().get("MODEL_CACHE_BUDGET_GB", None)
+MODEL_CACHE_MIN_FREE_GB = globals().get("MODEL_CACHE_MIN_FREE_GB", None)
+
 # Keycloak Addresses
 KEYCLOAK_BASE_URL = "keycloak." + BACKEND_LOCATION
 OPENTDF_BASE_URL = "opentdf." + BACKEND_LOCATION
@@ -238,6 +332,7 @@ keycloak = {
         "PROXY_ADDRESS_FORWARDING": "true",
         "KC_HTTP_RELATIVE_PATH": "/auth",
         "KC_DB_VENDOR": "postgres",
+        "KC_DB": "postgres",
         "KC_DB_URL_HOST": "keycloakdb",
         "KC_DB_URL_PORT": "5432",
         "KC_DB_URL_DATABASE": "keycloak",
@@ -267,6 +362,36 @@ keycloak = {
     },
 }
 
+# Keycloak replicas share sessions through Infinispan, discovering each other with
+# JDBC_PING over keycloakdb. nginx keeps a login flow on one replica (AUTH_SESSION_ID)
+# and routes around replicas that fail or report 5xx.
+KEYCLOAK_REPLICAS = globals().get("KEYCLOAK_REPLICAS", 1)
+keycloak_replicas = [keycloak]
+if KEYCLOAK_REPLICAS > 1:
+    keycloak["environment"]["KC_CACHE"] = "ispn"
+    keycloak["environment"]["KC_CACHE_STACK"] = "jdbc-ping"
+    for replica in range(2, KEYCLOAK_REPLICAS + 1):
+        keycloak_replica = copy.deepcopy(keycloak)
+        keycloak_replica["name"] = f"{keycloak['name']}_{replica}"
+        keycloak_replicas.append(keycloak_replica)
+
+KEYCLOAK_NGINX_UPSTREAM = "\n".join(
+    [
+        "map $cookie_AUTH_SESSION_ID $kc_session_affinity {",
+        '        ""      $remote_addr;',
+        "        default $cookie_AUTH_SESSION_ID;",
+        "    }",
+        "",
+        util.nginx_upstream(
+            "keycloak_cluster",
+            [replica["name"] for replica in keycloak_replicas],
+            8888,
+            balance="hash $kc_session_affinity consistent",
+            server_params="max_fails=3 fail_timeout=10s",
+        ),
+    ]
+)
+
 nginx = dict(
     image="nginx:latest",
     name="nginx",
@@ -352,7 +477,7 @@ webapp = dict(
 )
 
 go_installs_dir = os.path.join(
-    org_dir, "installs"
+    org_dir if not DENSITY_MODE else os.path.join(SHARED_ASSETS_DIR, "go"), "installs"
 )  # Directory to hold Go installs on the host
 
 org = dict(
@@ -404,6 +529,60 @@ synapse = dict(
     },
 )
 
+# Synapse cache and DB pool sizing. run.py recomputes these with
+# utils_synapse.tune_synapse once the database is up.
+SYNAPSE_CP_MIN = 5
+SYNAPSE_CP_MAX = 10
+SYNAPSE_CACHE_GLOBAL_FACTOR = 0.5
+SYNAPSE_EVENT_CACHE_SIZE = "10K"
+SYNAPSE_PER_CACHE_FACTORS = "{}"
+
+# Synapse worker mode: SYNAPSE_WORKERS generic workers plus a federation sender and
+# a media worker, replicating over Redis. 0 keeps the single monolithic process.
+SYNAPSE_WORKERS = globals().get("SYNAPSE_WORKERS", 0)
+SYNAPSE_NGINX_UPSTREAMS = utils_synapse.nginx_upstreams(SYNAPSE_WORKERS)
+SYNAPSE_NGINX_LOCATIONS = utils_synapse.nginx_locations(SYNAPSE_WORKERS)
+
+synapse_redis = dict(
+    image="redis:7-alpine",
+    detach=True,
+    name=utils_synapse.REDIS_HOST,
+    network=NETWORK_NAME,
+    restart_policy={"Name": "always"},
+    healthcheck={
+        "test": ["CMD", "redis-cli", "ping"],
+        "interval": 5000000000,  # 5s
+        "timeout": 5000000000,  # 5s
+        "retries": 5,
+    },
+)
+
+synapse_workers = []
+if SYNAPSE_WORKERS:
+    synapse["command"] = utils_synapse.worker_command("synapse.app.homeserver")
+
+    worker_ports = {
+        name: utils_synapse.GENERIC_WORKER_PORT
+        for name in utils_synapse.generic_worker_names(SYNAPSE_WORKERS)
+    }
+    worker_ports[utils_synapse.MEDIA_WORKER] = utils_synapse.MEDIA_WORKER_PORT
+    worker_ports[utils_synapse.FEDERATION_SENDER] = None
+
+    for worker_name, worker_port in worker_ports.items():
+        worker = copy.deepcopy(synapse)
+        worker["name"] = worker_name
+        worker["command"] = utils_synapse.worker_command(
+            "synapse.app.generic_worker", worker_name
+        )
+        if worker_port is None:
+            del worker["healthcheck"]
+        else:
+            worker["healthcheck"]["test"] = [
+                "CMD-SHELL",
+                f"curl -f http://localhost:{worker_port}/health || exit 1",
+            ]
+        synapse_workers.append(worker)
+
 synapsedb = copy.deepcopy(opentdfdb)
 synapsedb["name"] = "synapsedb"
 synapsedb["environment"]["POSTGRES_DB"] = "synapse"
@@ -416,120 +595,137 @@ synapsedb["volumes"] = {
 }
 
 
-# Base configuration
-ollama = {
-    "name": "ollama",
-    "ports": {"11434/tcp": 11434},
-    "network": NETWORK_NAME,
-    "detach": True,  # Runs the container in detached mode
-    "volumes": {
-        os.path.join(current_dir, "ollama", "ollama_models"): {
-            "bind": "/root/.ollama/models",
-            "mode": "rw",
+# Which GPU services get a GPU of their own (see utils_hardware.DEFAULT_PLACEMENT)
+GPU_PLACEMENT = globals().get("GPU_PLACEMENT", None)
+
+
+def _with_gpu(config, service):
+    """Give a GPU service config the GPUs the placement policy assigns it."""
+    import utils_hardware
+
+    gpus = _fact("gpus", _probe_gpus)
+    placement = utils_hardware.assign_gpus(
+        gpus, GPU_PLACEMENT or utils_hardware.DEFAULT_PLACEMENT
+    )
+    if placement.get(service):
+        config["device_requests"] = utils_hardware.device_requests(gpus, placement[service])
+    return config
+
+
+@_lazy("ollama")
+def _ollama():
+    config = {
+        "name": "ollama",
+        "ports": {"11434/tcp": 11434},
+        "network": NETWORK_NAME,
+        "detach": True,  # Runs the container in detached mode
+        "volumes": {
+            ollama_models_dir: {
+                "bind": "/root/.ollama/models",
+                "mode": "rw",
+            },
+            whisper_models_dir: {
+                "bind": "/data/cache/whisper/models",
+                "mode": "rw",
+            },
         },
-        os.path.join(current_dir, "ollama", "whisper_models"): {
-            "bind": "/data/cache/whisper/models",
-            "mode": "rw",
+        "environment": {
+            "OLLAMA_ORIGINS": "*",
+            "ENABLE_OLLAMA_API": "True",
+            "DATA_DIR": "/data",
         },
-    },
-    "environment": {
-        "OLLAMA_ORIGINS": "*",
-        "ENABLE_OLLAMA_API": "True",
-        "DATA_DIR": "/data",
-    },
-    "image": "ollama/ollama",
-}
-
-# Base configuration
-deepseek_janus = {
-    "name": "deepseek_janus",
-    "ports": {"8000/tcp": 8000},
-    "network": NETWORK_NAME,
-    "detach": True,  # Runs the container in detached mode
-    "volumes": {
-        os.path.join(current_dir, "huggingface"): {
-            "bind": "/root/.cache/huggingface",
-            "mode": "rw",
+        "image": "ollama/ollama",
+    }
+    return _with_gpu(config, "ollama")
+
+
+@_lazy("deepseek_janus")
+def _deepseek_janus():
+    config = {
+        "name": "deepseek_janus",
+        "ports": {"8000/tcp": 8000},
+        "network": NETWORK_NAME,
+        "detach": True,  # Runs the container in detached mode
+        "volumes": {
+            huggingface_dir: {
+                "bind": "/root/.cache/huggingface",
+                "mode": "rw",
+            },
         },
-    },
-    "environment": {
-        "MODEL_NAME": "deepseek-ai/Janus-Pro-1B",
-    },
-    "image": "julianfl0w/janus:latest",
-}
-
-sglang = dict(
-    image="lmsysorg/sglang:latest",
-    name="sglang",
-    volumes={
-        os.path.join(current_dir, "huggingface"): {
-            "bind": "/root/.cache/huggingface",
-            "mode": "rw",
+        "environment": {
+            "MODEL_NAME": "deepseek-ai/Janus-Pro-1B",
         },
-    },
-    restart_policy={"Name": "always"},
-    detach=True,
-    network=NETWORK_NAME,
-    # Uncomment if using port mapping instead of host mode
-    # "ports": {"30000/tcp": 30000},
-    environment={
-        "HF_TOKEN": "<secret>",
-        # Uncomment if using modelscope
-        # "SGLANG_USE_MODELSCOPE": "true"
-    },
-    entrypoint="python3 -m sglang.launch_server",
-    command=[
-        "--model-path",
-        "meta-llama/Llama-3.1-8B-Instruct",
-        "--host",
-        "0.0.0.0",
-        "--port",
-        "30000",
-    ],
-    ulimits=[
-        {"Name": "memlock", "Soft": -1, "Hard": -1},
-        {"Name": "stack", "Soft": 67108864, "Hard": 67108864},
-    ],
-    ipc_mode="host",
-    healthcheck={
-        "test": ["CMD-SHELL", "curl -f http://localhost:30000/health || exit 1"]
-    },
-)
+        "image": "julianfl0w/janus:latest",
+    }
+    return _with_gpu(config, "deepseek_janus")
+
+
+@_lazy("sglang")
+def _sglang():
+    config = dict(
+        image="lmsysorg/sglang:latest",
+        name="sglang",
+        volumes={
+            huggingface_dir: {
+                "bind": "/root/.cache/huggingface",
+                "mode": "rw",
+            },
+        },
+        restart_policy={"Name": "always"},
+        detach=True,
+        network=NETWORK_NAME,
+        # Uncomment if using port mapping instead of host mode
+        # "ports": {"30000/tcp": 30000},
+        environment={
+            "HF_TOKEN": "<secret>",
+            # Uncomment if using modelscope
+            # "SGLANG_USE_MODELSCOPE": "true"
+        },
+        entrypoint="python3 -m sglang.launch_server",
+        command=[
+            "--model-path",
+            "meta-llama/Llama-3.1-8B-Instruct",
+            "--host",
+            "0.0.0.0",
+            "--port",
+            "30000",
+        ],
+        ulimits=[
+            {"Name": "memlock", "Soft": -1, "Hard": -1},
+            {"Name": "stack", "Soft": 67108864, "Hard": 67108864},
+        ],
+        ipc_mode="host",
+        healthcheck={
+            "test": ["CMD-SHELL", "curl -f http://localhost:30000/health || exit 1"]
+        },
+    )
+    return _with_gpu(config, "sglang")
 
-from docker.types import DeviceRequest
 
-# Check for NVIDIA GPU
-if util.check_nvidia_gpu():
-    drequests = DeviceRequest(count=1, capabilities=[["gpu"]], driver="nvidia")
-    ollama["device_requests"] = [drequests]
-    sglang["device_requests"] = [drequests]
-    deepseek_janus["device_requests"] = [drequests]
+# BLUESKY CRYPTO SETUP
+@_lazy("JWT_SECRET")
+def _jwt_secret():
+    import secrets
+
+    if os.path.exists("jwt_secret.txt"):
+        with open("jwt_secret.txt", "r") as file:
+            return file.read()
+    jwt_secret = secrets.token_hex(16)
+    with open("jwt_secret.txt", "w+") as file:
+        file.write(jwt_secret)
+    return jwt_secret
 
-# Check for AMD GPU
-elif util.check_amd_gpu():
-    drequests = DeviceRequest(count=1, capabilities=[["gpu"]], driver="amd")
-    ollama["device_requests"] = [drequests]
-    sglang["device_requests"] = [drequests]
-    deepseek_janus["device_requests"] = [drequests]
 
-# BLUESKY CRYPTO SETUP
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives import serialization
-import secrets
-
-# Generate a secp256k1 private key
-private_key = ec.generate_private_key(ec.SECP256K1())
-private_key_bytes = private_key.private_numbers().private_value.to_bytes(
-    32, byteorder="big"
-)
+def _plc_rotation_key_hex():
+    """Generate a secp256k1 private key for the PDS's PLC rotation key."""
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256K1())
+    private_key_bytes = private_key.private_numbers().private_value.to_bytes(
+        32, byteorder="big"
+    )
+    return private_key_bytes.hex()
 
-if os.path.exists("jwt_secret.txt"):
-    with open("jwt_secret.txt", "r") as file:
-        JWT_SECRET = file.read()
-else:
-    JWT_SECRET = secrets.token_hex(16)
-    with open("jwt_secret.txt", "w+") as file:
-        file.write(JWT_SECRET)
 
 element = dict(
     image="vectorim/element-web:latest",
@@ -569,34 +765,38 @@ bsky_fyp["command"] = [
     "pip install atproto flask && python serve_vertical_fyp.py",
 ]
 
-bluesky = dict(
-    image="ghcr.io/bluesky-social/pds:latest",
-    detach=True,
-    name="pds",
-    network=NETWORK_NAME,  # Make sure it's on the same network as nginx
-    volumes={
-        "bluesky_pds": {"bind": "/pds", "mode": "rw"},
-    },
-    environment=dict(
-        DEBUG=1,
-        PDS_HOSTNAME=USER_WEBSITE,
-        PDS_JWT_SECRET=JWT_SECRET,
-        ADMIN_HANDLE="admin",
-        ADMIN_USERNAME="admin",
-        PDS_ADMIN_PASSWORD="changeme",
-        PDS_PLC_ROTATION_KEY_K256_PRIVATE_KEY_HEX=private_key_bytes.hex(),
-        PDS_DATA_DIRECTORY="/pds",
-        PDS_BLOBSTORE_DISK_LOCATION="/pds/blocks",
-        PDS_BLOB_UPLOAD_LIMIT=52428800,
-        PDS_DID_PLC_URL="https://plc.directory",
-        PDS_BSKY_APP_VIEW_URL="https://api.bsky.app",
-        PDS_BSKY_APP_VIEW_DID="did:web:api.bsky.app",
-        PDS_REPORT_SERVICE_URL="https://mod.bsky.app",
-        PDS_REPORT_SERVICE_DID="did:plc:ar7c4by46qjdydhdevvrndac",
-        PDS_CRAWLERS="https://bsky.network",
-        LOG_ENABLED="true",
-    ),
-)
+
+@_lazy("bluesky")
+def _bluesky():
+    config = dict(
+        image="ghcr.io/bluesky-social/pds:latest",
+        detach=True,
+        name="pds",
+        network=NETWORK_NAME,  # Make sure it's on the same network as nginx
+        volumes={
+            "bluesky_pds": {"bind": "/pds", "mode": "rw"},
+        },
+        environment=dict(
+            DEBUG=1,
+            PDS_HOSTNAME=USER_WEBSITE,
+            PDS_JWT_SECRET=sys.modules[__name__].JWT_SECRET,
+            ADMIN_HANDLE="admin",
+            ADMIN_USERNAME="admin",
+            PDS_ADMIN_PASSWORD="changeme",
+            PDS_PLC_ROTATION_KEY_K256_PRIVATE_KEY_HEX=_plc_rotation_key_hex(),
+            PDS_DATA_DIRECTORY="/pds",
+            PDS_BLOBSTORE_DISK_LOCATION="/pds/blocks",
+            PDS_BLOB_UPLOAD_LIMIT=52428800,
+            PDS_DID_PLC_URL="https://plc.directory",
+            PDS_BSKY_APP_VIEW_URL="https://api.bsky.app",
+            PDS_BSKY_APP_VIEW_DID="did:web:api.bsky.app",
+            PDS_REPORT_SERVICE_URL="https://mod.bsky.app",
+            PDS_REPORT_SERVICE_DID="did:plc:ar7c4by46qjdydhdevvrndac",
+            PDS_CRAWLERS="https://bsky.network",
+            LOG_ENABLED="true",
+        ),
+    )
+    return config
 
 
 gitea = dict(
@@ -623,3 +823,60 @@ act_runner = dict(
         "RUNNER_LABELS": "ubuntu-latest:docker://node:16-bullseye",
     },
 )
+
+
+# Container configs run.py starts for each entry in SERVICES_TO_RUN, as env attribute
+# names. An attribute may hold a single config or a list of them.
+SERVICE_CONTAINERS = {
+    "keycloak": ["keycloakdb", "keycloak_replicas"],
+    "webapp": ["webapp"],
+    "webapp_build": ["webapp_build"],
+    "nginx": ["nginx"],
+    "opentdf": ["opentdfdb", "opentdf"],
+    "org": ["org"],
+    "synapse": ["synapsedb", "synapse", "synapse_workers"]
+    + (["synapse_redis"] if SYNAPSE_WORKERS else []),
+    "element": ["element"],
+    "ollama": ["ollama", "deepseek_janus"],
+    "bluesky": ["bluesky", "bluesky_bridge", "bsky_fyp"],
+    "sglang": ["sglang"],
+}
+
+
+def container_configs(services=None):
+    """Container configs for the given services (default: SERVICES_TO_RUN)."""
+    configs = []
+    for service in SERVICES_TO_RUN if services is None else services:
+        for attr in SERVICE_CONTAINERS.get(service, []):
+            value = getattr(sys.modules[__name__], attr)
+            configs.extend(value if isinstance(value, list) else [value])
+    return configs
+
+
+def _apply_density(config):
+    """Namespace a container config for density mode (see DENSITY_MODE above)."""
+    name = config["name"]
+    alias = name[: -len(distinguisher)] if name.endswith(distinguisher) else name
+    config["name"] = alias + distinguisher
+    # Other containers on this deployment's network keep using the short name
+    config["aliases"] = [alias]
+    config.pop("ports", None)
+    volumes = {}
+    for source, target in config.get("volumes", {}).items():
+        if not os.path.isabs(source) and not source.endswith(distinguisher):
+            source += distinguisher  # named volume
+        volumes[source] = target
+    if "volumes" in config:
+        config["volumes"] = volumes
+
+
+if DENSITY_MODE:
+    for config in (webapp, webapp_build):
+        config["volumes"][npm_cache_dir] = {"bind": "/npm-cache", "mode": "rw"}
+        config["environment"]["npm_config_cache"] = "/npm-cache"
+    # Lazy configs are namespaced by __getattr__ when they're built
+    for attr in sum(SERVICE_CONTAINERS.values(), []):
+        if attr not in LAZY_ATTRIBUTES:
+            value = globals()[attr]
+            for config in value if isinstance(value, list) else [value]:
+                _apply_density(config)
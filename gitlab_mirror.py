@@ -0,0 +1,371 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+MIRROR_DB = os.path.join(here, "gitlab_mirror.sqlite")
+POLL_SECONDS = int(os.environ.get("GITLAB_MIRROR_POLL_SECONDS", 300))
+# Reads only sync inline when the mirror is older than this, i.e. when polling has
+# fallen behind; the poller and webhooks keep it fresh otherwise
+MAX_AGE_SECONDS = int(os.environ.get("GITLAB_MIRROR_MAX_AGE", 2 * POLL_SECONDS))
+# After a failed sync, wait this long (doubling per failure, up to MAX_RETRY_SECONDS)
+# before trying again, so reads don't each retry against a GitLab that is down
+RETRY_SECONDS = 30
+MAX_RETRY_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    iid INTEGER PRIMARY KEY, title TEXT, description TEXT, state TEXT, author TEXT,
+    labels TEXT, updated_at TEXT, web_url TEXT
+);
+CREATE TABLE IF NOT EXISTS merge_requests (
+    iid INTEGER PRIMARY KEY, title TEXT, description TEXT, state TEXT, author TEXT,
+    source_branch TEXT, target_branch TEXT, updated_at TEXT, web_url TEXT
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY, kind TEXT, iid INTEGER, author TEXT, body TEXT, created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS notes_parent ON notes (kind, iid, created_at);
+CREATE TABLE IF NOT EXISTS branches (
+    name TEXT PRIMARY KEY, commit_id TEXT, commit_title TEXT, committed_date TEXT,
+    merged INTEGER, protected INTEGER
+);
+CREATE TABLE IF NOT EXISTS sync_state (resource TEXT PRIMARY KEY, updated_after TEXT);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    kind UNINDEXED, iid UNINDEXED, title, body, tokenize = 'porter unicode61'
+);
+"""
+
+
+def _iso(timestamp):
+    """API timestamps are ISO 8601, webhook ones "2024-01-02 03:04:05 UTC"."""
+    if not timestamp or "T" in timestamp:
+        return timestamp
+    parsed = datetime.strptime(timestamp.replace(" UTC", ""), "%Y-%m-%d %H:%M:%S")
+    return parsed.replace(tzinfo=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _username(user):
+    return (user or {}).get("username", "")
+
+
+def _match(query):
+    """An FTS5 query matching all of the words in query, each as a prefix."""
+    words = ["".join(c for c in word if c.isalnum()) for word in query.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+class GitLabMirror:
+    """
+    SQLite copy of one project's issues, merge requests, their comments and its
+    branches, with full-text search over titles, descriptions and comments. Synced
+    incrementally with updated_after and updated in place from webhooks and writes.
+
+    _lock guards the database and is only held for its transactions; _sync_lock keeps
+    syncs (which spend their time on GitLab requests) from running twice at once.
+    """
+
+    def __init__(self, project, path=MIRROR_DB, max_age=MAX_AGE_SECONDS):
+        self.project = project  # python-gitlab Project
+        self.max_age = max_age
+        self.last_sync = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    # Writing
+
+    def _index(self, kind, iid):
+        """Rebuild the search row for an issue or merge request from the stored text."""
+        table = "issues" if kind == "issue" else "merge_requests"
+        row = self._db.execute(f"SELECT title, description FROM {table} WHERE iid = ?", (iid,)).fetchone()
+        self._db.execute("DELETE FROM search WHERE kind = ? AND iid = ?", (kind, iid))
+        if row:
+            comments = [body for (body,) in self._db.execute(
+                "SELECT body FROM notes WHERE kind = ? AND iid = ?", (kind, iid)
+            )]
+            self._db.execute(
+                "INSERT INTO search (kind, iid, title, body) VALUES (?, ?, ?, ?)",
+                (kind, iid, row[0] or "", "\n".join([row[1] or ""] + comments)),
+            )
+
+    def _store_issue(self, attrs, author):
+        self._db.execute(
+            """INSERT INTO issues VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (iid) DO UPDATE SET title = excluded.title,
+                description = excluded.description, state = excluded.state,
+                author = COALESCE(NULLIF(excluded.author, ''), issues.author),
+                labels = excluded.labels, updated_at = excluded.updated_at,
+                web_url = excluded.web_url""",
+            (
+                attrs["iid"], attrs.get("title"), attrs.get("description"), attrs.get("state"), author,
+                json.dumps([l if isinstance(l, str) else l.get("title") for l in attrs.get("labels") or []]),
+                _iso(attrs.get("updated_at")), attrs.get("web_url") or attrs.get("url"),
+            ),
+        )
+
+    def _store_merge_request(self, attrs, author):
+        self._db.execute(
+            """INSERT INTO merge_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (iid) DO UPDATE SET title = excluded.title,
+                description = excluded.description, state = excluded.state,
+                author = COALESCE(NULLIF(excluded.author, ''), merge_requests.author),
+                source_branch = excluded.source_branch, target_branch = excluded.target_branch,
+                updated_at = excluded.updated_at, web_url = excluded.web_url""",
+            (
+                attrs["iid"], attrs.get("title"), attrs.get("description"), attrs.get("state"), author,
+                attrs.get("source_branch"), attrs.get("target_branch"),
+                _iso(attrs.get("updated_at")), attrs.get("web_url") or attrs.get("url"),
+            ),
+        )
+
+    def _store_note(self, kind, iid, attrs, author):
+        if attrs.get("system"):
+            return  # "changed the description", "added 1 commit", ...
+        self._db.execute(
+            "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?)",
+            (attrs["id"], kind, iid, author, attrs.get("body") or attrs.get("note"), _iso(attrs.get("created_at"))),
+        )
+
+    def _sync_objects(self, kind, manager, store):
+        resource = kind + "s"
+        with self._lock:
+            row = self._db.execute(
+                "SELECT updated_after FROM sync_state WHERE resource = ?", (resource,)
+            ).fetchone()
+        params = dict(order_by="updated_at", sort="asc", iterator=True)
+        if row:
+            params["updated_after"] = row[0]
+        latest = row[0] if row else None
+        count = 0
+        for obj in manager.list(**params):
+            attrs = obj.attributes
+            notes = list(obj.notes.list(iterator=True, sort="asc"))
+            with self._lock, self._db:
+                store(attrs, _username(attrs.get("author")))
+                self._db.execute("DELETE FROM notes WHERE kind = ? AND iid = ?", (kind, attrs["iid"]))
+                for note in notes:
+                    self._store_note(kind, attrs["iid"], note.attributes, _username(note.attributes.get("author")))
+                self._index(kind, attrs["iid"])
+            latest = max(latest or "", _iso(attrs["updated_at"]))
+            count += 1
+        if latest:
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (resource, latest))
+        return count
+
+    def _sync_branches(self):
+        branches = list(self.project.branches.list(iterator=True))
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM branches")
+            for branch in branches:
+                commit = branch.attributes.get("commit") or {}
+                self._db.execute(
+                    "INSERT INTO branches VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        branch.name, commit.get("id"), commit.get("title"), _iso(commit.get("committed_date")),
+                        int(bool(branch.attributes.get("merged"))), int(bool(branch.attributes.get("protected"))),
+                    ),
+                )
+        return len(branches)
+
+    def sync(self, max_age=None):
+        """
+        Fetch everything updated since the last sync (everything, the first time).
+        With max_age, skip it if a sync that finished while we waited for another one
+        (or earlier) is at most that old. Returns the counts, or None if skipped.
+        """
+        with self._sync_lock:
+            if max_age is not None and time.time() - self.last_sync <= max_age:
+                return None
+            started = time.time()
+            try:
+                counts = dict(
+                    issues=self._sync_objects("issue", self.project.issues, self._store_issue),
+                    merge_requests=self._sync_objects(
+                        "merge_request", self.project.mergerequests, self._store_merge_request
+                    ),
+                    branches=self._sync_branches(),
+                )
+            except Exception:
+                self.failures += 1
+                self.retry_at = time.time() + min(MAX_RETRY_SECONDS, RETRY_SECONDS * 2 ** (self.failures - 1))
+                raise
+            self.failures = 0
+            self.last_sync = started
+            return counts
+
+    def ensure_fresh(self):
+        now = time.time()
+        if now - self.last_sync <= self.max_age or now < self.retry_at:
+            return
+        # Once there is data, serve it rather than queue behind a sync already running
+        if self.last_sync and self._sync_lock.locked():
+            return
+        try:
+            self.sync(max_age=self.max_age)
+        except Exception as e:
+            # Serve what we have rather than fail the read
+            print(f"GitLab mirror sync failed, retrying in {self.retry_at - time.time():.0f}s: {e}")
+
+    def start_polling(self, interval=POLL_SECONDS):
+        # Reads leave syncing to the poller unless it falls behind
+        self.max_age = max(self.max_age, interval)
+
+        def poll():
+            while True:
+                if time.time() >= self.retry_at:
+                    try:
+                        self.sync(max_age=interval / 2)
+                    except Exception as e:
+                        print(f"GitLab mirror sync failed: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=poll, name="gitlab-mirror", daemon=True).start()
+
+    def refresh_issue(self, iid):
+        """Re-read one issue after a write through the API."""
+        issue = self.project.issues.get(iid)
+        notes = list(issue.notes.list(iterator=True, sort="asc"))
+        with self._lock, self._db:
+            self._store_issue(issue.attributes, _username(issue.attributes.get("author")))
+            self._db.execute("DELETE FROM notes WHERE kind = 'issue' AND iid = ?", (iid,))
+            for note in notes:
+                self._store_note("issue", iid, note.attributes, _username(note.attributes.get("author")))
+            self._index("issue", iid)
+
+    def ingest_webhook(self, payload):
+        """Apply an issue, merge request, note or push webhook. Returns the event kind."""
+        kind = payload.get("object_kind")
+        attrs = payload.get("object_attributes") or {}
+        author = _username(payload.get("user"))
+        with self._lock, self._db:
+            if kind == "issue":
+                attrs = dict(attrs, labels=payload.get("labels") or attrs.get("labels"))
+                # The hook's user is whoever acted, only the author when opening
+                self._store_issue(attrs, author if attrs.get("action") == "open" else "")
+                self._index("issue", attrs["iid"])
+            elif kind == "merge_request":
+                self._store_merge_request(attrs, author if attrs.get("action") == "open" else "")
+                self._index("merge_request", attrs["iid"])
+            elif kind == "note" and attrs.get("noteable_type") in ("Issue", "MergeRequest"):
+                parent_kind = "issue" if attrs["noteable_type"] == "Issue" else "merge_request"
+                iid = (payload.get(parent_kind) or {}).get("iid")
+                if iid is not None:
+                    self._store_note(parent_kind, iid, attrs, author)
+                    self._index(parent_kind, iid)
+            elif kind == "push" and payload.get("ref", "").startswith("refs/heads/"):
+                name = payload["ref"][len("refs/heads/"):]
+                if set(payload.get("after", "")) == {"0"}:
+                    self._db.execute("DELETE FROM branches WHERE name = ?", (name,))
+                else:
+                    commit = (payload.get("commits") or [{}])[-1]
+                    self._db.execute(
+                        """INSERT INTO branches VALUES (?, ?, ?, ?, 0, 0)
+                        ON CONFLICT (name) DO UPDATE SET commit_id = excluded.commit_id,
+                            commit_title = excluded.commit_title,
+                            committed_date = excluded.committed_date""",
+                        (name, payload.get("after"), (commit.get("message") or "").split("\n")[0],
+                         _iso(commit.get("timestamp"))),
+                    )
+        return kind
+
+    # Reading
+
+    def _search_iids(self, kind, query):
+        return [iid for (iid,) in self._db.execute(
+            "SELECT iid FROM search WHERE kind = ? AND search MATCH ? ORDER BY rank", (kind, _match(query))
+        )]
+
+    def _list(self, kind, state, query, limit):
+        table = "issues" if kind == "issue" else "merge_requests"
+        sql = f"SELECT iid, title, state, author FROM {table}"
+        where, params = [], []
+        if state and state != "all":
+            where.append("state = ?")
+            params.append(state)
+        if query and _match(query):
+            iids = self._search_iids(kind, query)
+            where.append(f"iid IN ({','.join('?' * len(iids))})")
+            params += iids
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        return self._db.execute(sql, params + [limit]).fetchall()
+
+    def list_issues(self, state="opened", query=None, limit=50):
+        self.ensure_fresh()
+        with self._lock:
+            rows = self._list("issue", state, query, limit)
+        if not rows:
+            return "No open issues available"
+        return f"Found {len(rows)} issues:\n" + str([{"title": title, "number": iid} for iid, title, _, _ in rows])
+
+    def get_issue(self, iid):
+        self.ensure_fresh()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, description, author, state FROM issues WHERE iid = ?", (iid,)
+            ).fetchone()
+            if row is None:
+                return f"Issue {iid} not found"
+            comments = self._db.execute(
+                "SELECT author, body FROM notes WHERE kind = 'issue' AND iid = ? ORDER BY created_at LIMIT 10",
+                (iid,),
+            ).fetchall()
+        return str({
+            "title": row[0],
+            "body": row[1],
+            "comments": str([{"body": body, "user": author} for author, body in comments]),
+            "opened_by": row[2],
+            "state": row[3],
+        })
+
+    def list_merge_requests(self, state="opened", query=None, limit=50):
+        self.ensure_fresh()
+        with self._lock:
+            rows = self._list("merge_request", state, query, limit)
+        if not rows:
+            return f"No {state} merge requests" + (f" matching {query!r}" if query else "")
+        return f"Found {len(rows)} merge requests:\n" + "\n".join(
+            f"!{iid} [{mr_state}] {title} (by {author})" for iid, title, mr_state, author in rows
+        )
+
+    def list_branches(self, query=None):
+        self.ensure_fresh()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, commit_title, committed_date FROM branches ORDER BY committed_date DESC"
+            ).fetchall()
+        if query:
+            rows = [row for row in rows if query.lower() in row[0].lower()]
+        if not rows:
+            return "No branches found"
+        return f"Found {len(rows)} branches:\n" + "\n".join(
+            f"{name}: {title} ({date})" for name, title, date in rows
+        )
+
+    def search(self, query, limit=20):
+        """Issues and merge requests whose title, description or comments match."""
+        if not _match(query):
+            return "Give some words to search for"
+        self.ensure_fresh()
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT kind, iid, title, snippet(search, 3, '[', ']', '...', 12) FROM search
+                WHERE search MATCH ? ORDER BY rank LIMIT ?""",
+                (_match(query), limit),
+            ).fetchall()
+        if not rows:
+            return f"Nothing in issues or merge requests matches {query!r}"
+        return "\n".join(
+            f"{'#' if kind == 'issue' else '!'}{iid} {title}: {snippet}" for kind, iid, title, snippet in rows
+        )
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+CACHE_FILE = os.path.join(here, "llm_cache.sqlite")
+
+# Routes whose answers are never stored: secrets may be read back into a response
+NEVER_CACHE = ("secrets",)
+# Routes whose prompts keep their case: in code, Foo and FOO are different names
+CASE_SENSITIVE = ("code",)
+
+
+def normalize_prompt(prompt: str, casefold: bool = True) -> str:
+    """Whitespace, trailing punctuation and (unless casefold is False) case don't change the answer we want."""
+    prompt = re.sub(r"\s+", " ", prompt).strip().rstrip("?!.").strip()
+    return prompt.casefold() if casefold else prompt
+
+
+class ResponseCache:
+    """
+    SQLite cache of LLM responses keyed on model, normalized prompt and a fingerprint of
+    whatever state the tools would have read (e.g. which containers exist). Entries
+    expire after ttl seconds and the least recently used are evicted past max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_FILE,
+        ttl: float = 3600,
+        max_entries: int = 5000,
+        never_cache=NEVER_CACHE,
+        case_sensitive=CASE_SENSITIVE,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.never_cache = set(never_cache)
+        self.case_sensitive = set(case_sensitive)
+        self.metrics: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.RLock()  # re-entered by _count from get()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                route TEXT,
+                model TEXT,
+                response TEXT,
+                created REAL,
+                last_used REAL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def key(self, route: str, model: str, prompt: str, fingerprint: str = "") -> str:
+        normalized = normalize_prompt(prompt, casefold=route not in self.case_sensitive)
+        data = "\0".join([model, normalized, fingerprint])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _count(self, route: str, outcome: str):
+        with self._lock:
+            counts = self.metrics.setdefault(route, dict(hits=0, misses=0, bypassed=0))
+            counts[outcome] += 1
+
+    def get(self, route: str, model: str, prompt: str, fingerprint: str = "") -> Optional[str]:
+        """The cached response, or None on a miss (or for routes that are never cached)."""
+        if route in self.never_cache:
+            self._count(route, "bypassed")
+            return None
+        key = self.key(route, model, prompt, fingerprint)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self._count(route, "misses")
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._count(route, "hits")
+        return row[0]
+
+    def put(self, route: str, model: str, prompt: str, response: str, fingerprint: str = ""):
+        if route in self.never_cache:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(route, model, prompt, fingerprint), route, model, response, now, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def get_or_compute(
+        self,
+        route: str,
+        model: str,
+        prompt: str,
+        compute: Callable[[], str],
+        fingerprint: Optional[Callable[[], str]] = None,
+        keep: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        Cached response for prompt, calling compute() on a miss. fingerprint is only
+        called for cacheable routes. Exceptions from compute() are not cached, nor are
+        responses keep() rejects.
+        """
+        if route in self.never_cache:
+            self._count(route, "bypassed")
+            return compute()
+        state = fingerprint() if fingerprint else ""
+        response = self.get(route, model, prompt, state)
+        if response is None:
+            response = compute()
+            if keep is None or keep(response):
+                self.put(route, model, prompt, response, state)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        totals = dict(hits=0, misses=0, bypassed=0)
+        for counts in self.metrics.values():
+            for outcome, count in counts.items():
+                totals[outcome] += count
+        lookups = totals["hits"] + totals["misses"]
+        return dict(
+            entries=entries,
+            hit_rate=totals["hits"] / lookups if lookups else 0.0,
+            routes=self.metrics,
+            **totals,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
@@ -8,7 +8,6 @@ from langchain.agents import Tool, AgentExecutor
 from langchain.agents import create_openai_tools_agent
 from langchain_anthropic import ChatAnthropic
 from langchain_community.tools import DuckDuckGoSearchRun
-from langchain_community.tools.gitlab.tool import GitLabAction
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -16,10 +15,16 @@ from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph, add_messages
-from langgraph.prebuilt import ToolNode
 from langgraph.store.memory import InMemoryStore
 
-from tool_docker import create_docker_tools
+import checkpoints
+from context_window import ContextManager, context_messages
+from llm_cache import ResponseCache
+from parallel_tools import ParallelToolAgent, ParallelToolNode
+from query_router import KeywordRouter, OllamaEmbedder, SemanticRouter
+from streaming import FirstTokenTimer, message_text, token_events
+from tool_docker import DockerTools, create_docker_tools
+from tool_gitlab import create_gitlab_tools
 from tool_graph import create_graph_visualization_tool
 from tool_openbao import create_secrets_tools
 
@@ -34,9 +39,15 @@ class QueryType(Enum):
     END = "end"
 
 
+keyword_router = KeywordRouter()
+# Swapped for a SemanticRouter when SEMANTIC_ROUTER is set
+router = keyword_router
+
+
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     query_type: str
+    summary: str  # rolling summary of turns trimmed from messages
 
 
 def create_agent_executor(llm: BaseLanguageModel, toollist: List[Tool], system_prompt: str) -> AgentExecutor:
@@ -82,51 +93,16 @@ def detect_query_type(state: State) -> str:
             return QueryType.TOOLS.value
         return QueryType.END.value
 
-    content = content.lower()
-
-    # Check for secrets management keywords first
-    secrets_keywords = [
-        "secret", "vault", "credential", "password", "token", "key",
-        "certificate", "cert", "openbao", "bao", "kv"
-    ]
-
-    if any(keyword in content for keyword in secrets_keywords):
-        return QueryType.SECRETS.value
-
-    # Add GitLab-specific keywords
-    gitlab_keywords = [
-        "gitlab", "merge request", "mr", "pipeline", "ci/cd",
-        "issue", "repository", "repo", "commit", "branch"
-    ]
-
-    if any(keyword in content for keyword in gitlab_keywords):
-        return QueryType.GITLAB.value
-
-    # Define system/ops related keywords that should NOT go to the code model
-    ops_keywords = [
-        "docker", "kubernetes", "k8s", "logs", "monitoring", "deployment",
-        "container", "pod", "service", "cluster", "node", "volume",
-        "namespace", "config", "configuration", "system", "environment",
-        "infrastructure", "server", "cloud", "aws", "azure", "gcp"
-    ]
-
-    # Check for ops-related content first
-    if any(keyword in content for keyword in ops_keywords):
-        return QueryType.CHAT_LLAMA.value  # Changed from CHAT_MISTRAL
-
-    code_keywords = [
-        "code", "function", "programming", "debug", "error",
-        "python", "javascript", "java", "cpp", "c++",
-        "algorithm", "compile", "syntax", "git", "github"
-    ]
-
-    if any(keyword in content for keyword in code_keywords):
-        return QueryType.CODE.value
+    # Secrets, GitLab, ops (llama) or code, by weighted whole-word keyword hits
+    # (and example prompt embeddings with SEMANTIC_ROUTER)
+    route = router.route(content)
+    if route is not None:
+        return route
 
     message_count = len([m for m in messages if isinstance(m, (tuple, HumanMessage))])
     return QueryType.CHAT_HAIKU.value if message_count % 2 == 0 else QueryType.CHAT_LLAMA.value  # Changed from CHAT_MISTRAL
 
-def create_gitlab_agent(llm: BaseLanguageModel) -> AgentExecutor:
+def create_gitlab_agent(llm: BaseLanguageModel, gitlab_tools: List[Tool]) -> AgentExecutor:
     """Create a GitLab-specific agent with proper tool configuration."""
     prompt = ChatPromptTemplate.from_messages([
         ("system", """You are a GitLab operations specialist. Use the available tools to interact with GitLab.
@@ -156,8 +132,8 @@ def create_gitlab_agent(llm: BaseLanguageModel) -> AgentExecutor:
 class GitLabNode:
     """Node for handling GitLab-related operations."""
 
-    def __init__(self, llm: BaseLanguageModel):
-        self.agent = create_gitlab_agent(llm)
+    def __init__(self, llm: BaseLanguageModel, gitlab_tools: List[Tool]):
+        self.agent = create_gitlab_agent(llm, gitlab_tools)
         self.tools = {tool.name: tool for tool in gitlab_tools}
         print("GitLabNode initialized with new agent configuration")
 
@@ -168,13 +144,22 @@ class GitLabNode:
             content = last_message.content if hasattr(last_message, 'content') else str(last_message)
             content_lower = content.lower()
 
+            import re
+            mentions_mrs = re.search(r"\b(merge requests?|mrs?|pull requests?|prs?)\b", content_lower)
+
             # Map queries to specific tools and format inputs appropriately
-            if "show" in content_lower or "list" in content_lower:
-                if "issue" in content_lower:
-                    return self._execute_tool("list_issues", "")
-                elif "detail" in content_lower and "issue" in content_lower:
+            if re.match(r"\s*(search|find)\b", content_lower):
+                return self._execute_tool("search_gitlab", self._extract_search_query(content))
+            elif "show" in content_lower or "list" in content_lower:
+                if "detail" in content_lower and "issue" in content_lower:
                     issue_number = self._extract_issue_number(content)
                     return self._execute_tool("get_issue", str(issue_number))
+                elif "issue" in content_lower:
+                    return self._execute_tool("list_issues", "")
+                elif mentions_mrs:
+                    return self._execute_tool("list_merge_requests", "")
+                elif "branch" in content_lower:
+                    return self._execute_tool("list_branches", "")
             elif "comment" in content_lower and "issue" in content_lower:
                 issue_number = self._extract_issue_number(content)
                 comment_text = self._extract_comment_text(content)
@@ -200,7 +185,8 @@ class GitLabNode:
                 file_path = self._extract_file_path(content)
                 return self._execute_tool("delete_file", file_path)
 
-            return {"messages": [AIMessage(content="Please specify a valid GitLab operation (list issues, create file, etc.)")]}
+            return {"messages": [AIMessage(
+                content="Please specify a valid GitLab operation (list issues, list merge requests, search, create file, etc.)")]}
 
         except Exception as ex:
             error_msg = f"Error in GitLabNode processing: {type(ex).__name__}: {str(ex)}"
@@ -226,6 +212,12 @@ class GitLabNode:
         except:
             return 1
 
+    def _extract_search_query(self, content: str) -> str:
+        """Extract the words to search for from content."""
+        import re
+        match = re.match(r"\s*(?:search|find)\s+(?:gitlab\s+)?(?:for\s+)?(.*)", content, re.IGNORECASE | re.DOTALL)
+        return match.group(1).strip(" ?.'\"") if match else content
+
     def _extract_comment_text(self, content: str) -> str:
         """Extract comment text from content."""
         try:
@@ -272,8 +264,9 @@ class GitLabNode:
 class CodeNode:
     """Node specifically for handling code-related queries with Deepseek."""
 
-    def __init__(self, llm: ChatOllama):
+    def __init__(self, llm: ChatOllama, cache: ResponseCache = None):
         self.llm = llm
+        self.cache = cache
 
     def process_state(self, state: State) -> dict:
         """Process code-related queries directly with Deepseek."""
@@ -284,14 +277,25 @@ class CodeNode:
             else:
                 content = last_message.content
 
+            # Follow-ups like "now make it async" need the earlier turns
+            context = context_messages(state)
             messages = [
                 SystemMessage(
                     content="You are a code-focused AI assistant. Provide clean, well-documented code and clear explanations."),
+                *context,
                 HumanMessage(content=content)
             ]
 
-            response = self.llm.invoke(messages)
-            return {"messages": [response]}
+            # Streamed, so graph.stream(stream_mode="messages") sees tokens as they arrive
+            complete = lambda: "".join(message_text(chunk) for chunk in self.llm.stream(messages))
+            if self.cache is None:
+                output = complete()
+            else:
+                output = self.cache.get_or_compute(
+                    QueryType.CODE.value, self.llm.model, content, complete,
+                    fingerprint=lambda: "\n".join(message_text(message) for message in context),
+                )
+            return {"messages": [AIMessage(content=output)]}
         except Exception as ex:
             print(f"Error in CodeNode processing: {str(ex)}")
             return {"messages": [AIMessage(
@@ -301,8 +305,9 @@ class CodeNode:
 class SecretsNode:
     """Node for handling secrets management operations."""
 
-    def __init__(self, agent: AgentExecutor):
+    def __init__(self, agent: ParallelToolAgent, cache: ResponseCache = None):
         self.agent = agent
+        self.cache = cache
 
     def process_state(self, state: State) -> dict:
         """Process secrets management queries using the agent executor."""
@@ -310,8 +315,14 @@ class SecretsNode:
             last_message = state["messages"][-1]
             content = last_message.content if hasattr(last_message, 'content') else str(last_message)
 
-            response = self.agent.invoke({"input": content})
-            return {"messages": [AIMessage(content=response["output"])]}
+            if self.cache is not None:
+                # Only counted: the secrets route is never stored
+                output = self.cache.get_or_compute(
+                    QueryType.SECRETS.value, "", content, lambda: self.agent.invoke({"input": content})["output"]
+                )
+            else:
+                output = self.agent.invoke({"input": content})["output"]
+            return {"messages": [AIMessage(content=output)]}
         except json.JSONDecodeError as e:
             error_msg = f"Invalid secret format: {str(e)}. Please use the format '/path key value' or provide valid JSON."
             print(error_msg)
@@ -325,8 +336,15 @@ class SecretsNode:
 class ChatNode:
     """Node for handling chat queries with tools."""
 
-    def __init__(self, agent: AgentExecutor):
+    def __init__(self, agent: ParallelToolAgent, route: str = None, model: str = "", cache: ResponseCache = None,
+                 fingerprint=None, cacheable_tools=()):
         self.agent = agent
+        self.route = route
+        self.model = model
+        self.cache = cache
+        self.fingerprint = fingerprint  # state the agent's tools read, so stale answers miss
+        # Tools whose results fingerprint covers; answers that used any other tool aren't stored
+        self.cacheable_tools = set(cacheable_tools)
 
     def process_state(self, state: State) -> dict:
         """Process chat queries using the agent executor."""
@@ -334,8 +352,28 @@ class ChatNode:
             last_message = state["messages"][-1]
             content = last_message.content if hasattr(last_message, 'content') else str(last_message)
 
-            response = self.agent.invoke({"input": content})
-            output = response["output"]
+            if self.cache is not None:
+                steps = []
+
+                def answer():
+                    result = self.agent.invoke({"input": content})
+                    steps.extend(result.get("intermediate_steps", []))
+                    return result["output"]
+
+                def keep(response):
+                    # Not worth replaying for the whole TTL: empty answers, answers built on a
+                    # failed or timed-out tool, and tools the fingerprint doesn't cover
+                    return (
+                        bool(response.strip())
+                        and all(action.tool in self.cacheable_tools for action, _ in steps)
+                        and not any(str(observation).startswith("SYSTEM ERROR:") for _, observation in steps)
+                    )
+
+                output = self.cache.get_or_compute(
+                    self.route, self.model, content, answer, fingerprint=self.fingerprint, keep=keep,
+                )
+            else:
+                output = self.agent.invoke({"input": content})["output"]
 
             # Check for definitive system responses
             if output.startswith("SYSTEM STATUS:") or output.startswith("SYSTEM ERROR:"):
@@ -367,8 +405,14 @@ def new_function():
     """Placeholder for a new function."""
     pass
 
-def stream_graph_updates(u_input: str):
-    """Stream graph updates with proper checkpointing configuration."""
+# Time to first token per node, across the session
+first_token_timer = FirstTokenTimer()
+# Runs the graph's tool calls; set by build_graph
+tool_node: ParallelToolNode = None
+
+
+def stream_graph_updates(graph, u_input: str, thread_id: str = None):
+    """Print the reply token by token as the models produce it."""
     try:
         print("\n=== Stream Graph Updates ===")
         # print(f"stream_graph_updates {u_input}")
@@ -380,24 +424,27 @@ def stream_graph_updates(u_input: str):
         # print(f"initial_state {initial_state}")
         config = {
             "configurable": {
-                "thread_id": str(uuid4()),
+                "thread_id": thread_id or str(uuid4()),
                 "checkpoint_ns": "chat_interaction"
-            }
+            },
+            "callbacks": [first_token_timer],
         }
         # print(f"config {config}")
         # print("Starting graph stream...")
-        for event in graph.stream(initial_state, config=config):
-            # print(f"Processing event: {event}")
-            for value in event.values():
-                if "messages" in value:
-                    message = value["messages"][-1]
-                    # print(f"Message type: {type(message)}")
-                    if isinstance(message, (HumanMessage, SystemMessage, AIMessage)):
-                        print("Assistant:", message.content)
-                    elif isinstance(message, tuple):
-                        print("Assistant:", message[1])
-                    else:
-                        print("Assistant:", message)
+        streamed_nodes = set()
+        streaming = False
+        for event in graph.stream(initial_state, config=config, stream_mode=["messages", "updates"]):
+            for kind, node, text in token_events(event, streamed_nodes):
+                if kind == "token":
+                    if not streaming:
+                        print("Assistant: ", end="")
+                        streaming = True
+                    print(text, end="", flush=True)
+                elif kind == "end":
+                    print()
+                    streaming = False
+                else:
+                    print("Assistant:", text)
     except Exception as ex:
         print(f"Error in stream_graph_updates: {str(ex)}")
         print(f"Full error details: ", ex.__dict__)  # Add more error details for debugging
@@ -416,26 +463,6 @@ def load_env(file_path=".env"):
             os.environ[key.strip()] = value.strip()
 
 
-def create_gitlab_tool(name: str, description: str, mode: str) -> Tool:
-    """Create a GitLab tool with proper run method."""
-    gitlab_action = GitLabAction(
-        name=name,
-        description=description,
-        mode=mode
-    )
-
-    def tool_function(instructions: str) -> str:
-        try:
-            return gitlab_action.run(instructions)
-        except Exception as e:
-            return f"Error executing GitLab operation: {str(e)}"
-
-    return Tool(
-        name=name,
-        func=tool_function,
-        description=description
-    )
-
 def create_node_with_logging(node_name, node):
     def logged_process(state):
         # print(f"Processing in {node_name} node")
@@ -449,9 +476,35 @@ def create_node_with_logging(node_name, node):
 
     return logged_process
 
-if __name__ == "__main__":
-    load_env()
 
+def configure_router():
+    """Route with embeddings as well as keywords when SEMANTIC_ROUTER is set."""
+    global router
+    if os.environ.get("SEMANTIC_ROUTER"):
+        print("Routing with embeddings from " + os.environ.get("EMBEDDING_MODEL", "nomic-embed-text"))
+        router = SemanticRouter(
+            keyword_router,
+            embed=OllamaEmbedder(model=os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")),
+        )
+
+
+def create_response_cache():
+    """The response cache shared by the nodes, or None with LLM_CACHE=0."""
+    # Identical questions reuse answers
+    if os.environ.get("LLM_CACHE", "1") == "0":
+        return None
+    return ResponseCache(
+        ttl=float(os.environ.get("LLM_CACHE_TTL", 3600)),
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000)),
+    )
+
+
+
+def build_graph(checkpointer=None, store=None, cache: ResponseCache = None):
+    """
+    Create the models, tools and nodes and compile the graph. Conversation state lives
+    in the checkpointer, so one compiled graph can serve any number of sessions.
+    """
     # Initialize models
     api_key: str = os.environ.get('ANTHROPIC_API_KEY')
     if not api_key:
@@ -471,98 +524,23 @@ if __name__ == "__main__":
         func=ddg.run,
         description="Useful for searching the internet for current information."
     )
-    # Initialize GitLab tools
-    gitlab_tools = [
-        Tool(
-            name="list_issues",
-            description="List all open issues in the repository. Returns issue titles and numbers.",
-            func=lambda x: GitLabAction(
-                mode="get_issues",
-                name="list_issues",
-                description="List all open issues"
-            ).run("")
-        ),
-
-        Tool(
-            name="get_issue",
-            description="Get details about a specific issue including its title, body, and first 10 comments. Input should be an issue number.",
-            func=lambda x: GitLabAction(
-                mode="get_issue",
-                name="get_issue",
-                description="Get specific issue details"
-            ).run(x)
-        ),
-
-        Tool(
-            name="comment_on_issue",
-            description="Add a comment to a specific issue. Input format should be: 'issue_number\\n\\ncomment_text'",
-            func=lambda x: GitLabAction(
-                mode="comment_on_issue",
-                name="comment_on_issue",
-                description="Comment on an issue"
-            ).run(x)
-        ),
-
-        Tool(
-            name="create_file",
-            description="Create a new file in the repository. Input format should be: 'file_path\\nfile_contents'",
-            func=lambda x: GitLabAction(
-                mode="create_file",
-                name="create_file",
-                description="Create a new file"
-            ).run(x)
-        ),
-
-        Tool(
-            name="create_pull_request",
-            description="Create a new pull request. Input format should be: 'PR_title\\nPR_body'",
-            func=lambda x: GitLabAction(
-                mode="create_pull_request",
-                name="create_pull_request",
-                description="Create a pull request"
-            ).run(x)
-        ),
-
-        Tool(
-            name="read_file",
-            description="Read the contents of a file from the repository. Input should be the file path.",
-            func=lambda x: GitLabAction(
-                mode="read_file",
-                name="read_file",
-                description="Read file contents"
-            ).run(x)
-        ),
-
-        Tool(
-            name="update_file",
-            description="Update an existing file. Input format should be: 'file_path\\nOLD <<<<\\nold_content\\n>>>> OLD\\nNEW <<<<\\nnew_content\\n>>>> NEW'",
-            func=lambda x: GitLabAction(
-                mode="update_file",
-                name="update_file",
-                description="Update file contents"
-            ).run(x)
-        ),
-
-        Tool(
-            name="delete_file",
-            description="Delete a file from the repository. Input should be the file path.",
-            func=lambda x: GitLabAction(
-                mode="delete_file",
-                name="delete_file",
-                description="Delete a file"
-            ).run(x)
-        )
-    ]
+    gitlab_tools = create_gitlab_tools()
 
     # Add graph visualization tool
     graph_viz_tool = create_graph_visualization_tool()
     # docker log
-    docker_tools = create_docker_tools()
+    docker_client_tools = DockerTools()
+    docker_tools = create_docker_tools(docker_client_tools)
     secrets_tools = create_secrets_tools()
     # Combine all tools
     tools = [search_tool, graph_viz_tool] + gitlab_tools + docker_tools
     for tool in tools:
         print(f"Tool name: {tool.name}")
+    # The agents run their tool calls through this node too, all of a turn's at once
+    global tool_node
+    tool_node = ParallelToolNode(tools)
+    # GitLabNode calls its tools directly, so they only get the timeouts
+    gitlab_tools = [tool_node.wrap(tool) for tool in gitlab_tools]
 
     # Create agent executors with specific prompts
     docker_prompt = """When handling Docker-related queries:
@@ -617,12 +595,13 @@ if __name__ == "__main__":
     llama_prompt += "\n" + secrets_prompt
 
     # Create agents with simplified prompts
-    haiku_agent = create_agent_executor(haiku, tools, haiku_prompt)
-    llama_agent = create_agent_executor(llama, tools, llama_prompt)
-    secrets_agent = create_agent_executor(
+    haiku_agent = ParallelToolAgent(haiku, tools, haiku_prompt, tool_node)
+    llama_agent = ParallelToolAgent(llama, tools, llama_prompt, tool_node)
+    secrets_agent = ParallelToolAgent(
         llm=llama,
-        toollist=secrets_tools,
-        system_prompt=secrets_prompt
+        tools=secrets_tools,
+        system_prompt=secrets_prompt,
+        tool_node=tool_node
     )
     gitlab_agent = create_agent_executor(
         llm=haiku,
@@ -645,12 +624,16 @@ if __name__ == "__main__":
 
     # Create nodes
     print("Creating nodes...")
-    haiku_node = ChatNode(haiku_agent)
-    llama_node = ChatNode(llama_agent)  # Changed from mistral_node
-    deepseek_node = CodeNode(deepseek)
-    tool_node = ToolNode(tools=tools)
-    gitlab_node = GitLabNode(haiku)
-    secrets_node = SecretsNode(secrets_agent)
+    # Only docker state is fingerprinted, so answers from search, GitLab etc. aren't cached
+    docker_tool_names = [tool.name for tool in docker_tools]
+    haiku_node = ChatNode(haiku_agent, QueryType.CHAT_HAIKU.value, haiku.model, cache,
+                          fingerprint=docker_client_tools.state_fingerprint, cacheable_tools=docker_tool_names)
+    llama_node = ChatNode(llama_agent, QueryType.CHAT_LLAMA.value, llama.model, cache,
+                          fingerprint=docker_client_tools.state_fingerprint,
+                          cacheable_tools=docker_tool_names)  # Changed from mistral_node
+    deepseek_node = CodeNode(deepseek, cache)
+    gitlab_node = GitLabNode(haiku, gitlab_tools)
+    secrets_node = SecretsNode(secrets_agent, cache)
 
     # Build graph
     print("Setting up graph...")
@@ -688,9 +671,12 @@ if __name__ == "__main__":
         QueryType.END.value: END
     }
 
-    # Add edges from START
+    # Trim the history to the chosen model's budget before routing to it
+    context_manager = ContextManager(summarizer=llama, route=detect_query_type)
+    graph_builder.add_node("context", create_node_with_logging("context", context_manager))
+    graph_builder.add_edge(START, "context")
     graph_builder.add_conditional_edges(
-        START,
+        "context",
         detect_query_type_with_logging,
         edges
     )
@@ -704,8 +690,8 @@ if __name__ == "__main__":
         )
         print(f"Added edges for node: {node_name}")
 
-    checkpointer = MemorySaver()
-    kvstore = InMemoryStore()
+    checkpointer = checkpointer or MemorySaver()
+    kvstore = store or InMemoryStore()
     # Compile graph
     print("\nCompiling graph...")
     graph = graph_builder.compile(
@@ -713,6 +699,21 @@ if __name__ == "__main__":
         store=kvstore
     )
     print("Graph compilation complete")
+    return graph
+
+
+if __name__ == "__main__":
+    load_env()
+    configure_router()
+    cache = create_response_cache()
+    print(f"Compacted checkpoints: {checkpoints.compact()}")
+    graph = build_graph(
+        checkpointer=checkpoints.open_checkpointer(), store=checkpoints.open_store(), cache=cache
+    )
+    # The same conversation every time this user starts the CLI
+    thread_id = checkpoints.thread_id_for(os.environ.get("CHAT_USER"))
+    turns = 0
+
     # Test specific GitLab operations
     # test_queries = [
     #     "show all open issues",  # Tests get_issues mode
@@ -746,7 +747,7 @@ if __name__ == "__main__":
     # print("\nTesting with full debug output:")
     # stream_graph_updates(test_query)
     # LangGraph visualization
-    mermaid_diagram = graph_viz_tool.func(graph_builder, "Current System Structure")
+    mermaid_diagram = create_graph_visualization_tool().func(graph.builder, "Current System Structure")
     print(mermaid_diagram)
 
     print("Multi-LLM chat system initialized. Type 'quit' to exit.")
@@ -756,10 +757,17 @@ if __name__ == "__main__":
         try:
             user_input = input("User: ")
             if user_input.lower() in ["quit", "exit", "q"]:
+                if cache is not None:
+                    print(f"Response cache: {json.dumps(cache.stats())}")
+                print(f"Time to first token: {json.dumps(first_token_timer.summary())}")
+                print(f"Tool latency: {json.dumps(tool_node.stats())}")
                 print("Goodbye!")
                 break
 
-            stream_graph_updates(user_input)
+            stream_graph_updates(graph, user_input, thread_id)
+            turns += 1
+            if turns % 50 == 0:
+                checkpoints.compact()
         except Exception as e:
             print(f"An error occurred: {e}")
             print(f"Error details: {str(e)}")
@@ -0,0 +1,189 @@
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, List, Optional
+
+from langchain_core.agents import AgentAction
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import BaseTool, Tool
+
+from streaming import message_text
+
+# Seconds each tool may run; anything slower is reported as a timeout. Writes get None:
+# an abandoned write still lands, and a model told it failed would likely repeat it.
+TOOL_TIMEOUTS: Dict[str, Optional[float]] = {
+    "search": 15,
+    "docker_ps": 10,
+    "docker_log_analysis": 30,
+    "visualize_graph": 10,
+    "comment_on_issue": None,
+    "create_file": None,
+    "update_file": None,
+    "delete_file": None,
+    "create_pull_request": None,
+    "write_secret": None,
+    "delete_secret": None,
+}
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", 20))
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", 8))
+
+
+class ParallelToolNode:
+    """
+    Runs all tool calls of an AI message at once on a bounded thread pool. Each call
+    gets its tool's timeout; calls that miss it are answered with a SYSTEM ERROR:
+    TIMEOUT message while the other results still come back. A call still queued when
+    it times out is cancelled; one already running can't be interrupted, so it is
+    abandoned and its result dropped.
+    """
+
+    def __init__(
+        self,
+        tools: List[BaseTool],
+        timeouts: Dict[str, float] = TOOL_TIMEOUTS,
+        default_timeout: float = DEFAULT_TOOL_TIMEOUT,
+        max_workers: int = TOOL_WORKERS,
+    ):
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.latencies: Dict[str, deque] = {}
+        self.timeout_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.latencies.setdefault(name, deque(maxlen=500)).append(time.perf_counter() - start)
+
+    def _timeout_text(self, name, timeout):
+        with self._lock:
+            self.timeout_counts[name] = self.timeout_counts.get(name, 0) + 1
+        return f"SYSTEM ERROR: TIMEOUT - {name} did not finish within {timeout:g}s"
+
+    def _timeout(self, name) -> Optional[float]:
+        return self.timeouts[name] if name in self.timeouts else self.default_timeout
+
+    def run_calls(self, calls, tools: Dict[str, BaseTool] = None) -> List[ToolMessage]:
+        """A ToolMessage per tool call, in order, from running them all at once."""
+        tools = self.tools if tools is None else tools
+        started = time.monotonic()
+        pending = []
+        for call in calls:
+            tool = tools.get(call["name"])
+            if tool is None:
+                pending.append((call, None, 0))
+                continue
+            future = self.executor.submit(self._timed, call["name"], tool.invoke, {**call, "type": "tool_call"})
+            pending.append((call, future, self._timeout(call["name"])))
+
+        messages = []
+        for call, future, timeout in pending:
+            if future is None:
+                content, status = f"SYSTEM ERROR: no tool named {call['name']}", "error"
+            else:
+                try:
+                    remaining = None if timeout is None else max(0.0, started + timeout - time.monotonic())
+                    result = future.result(timeout=remaining)
+                    if isinstance(result, ToolMessage):
+                        messages.append(result)
+                        continue
+                    content, status = str(result), "success"
+                except TimeoutError:
+                    future.cancel()
+                    content, status = self._timeout_text(call["name"], timeout), "error"
+                except Exception as e:
+                    content, status = f"SYSTEM ERROR: {call['name']} failed: {e}", "error"
+            messages.append(ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status=status))
+        return messages
+
+    def process_state(self, state) -> dict:
+        """Answer every tool call in the last message, concurrently."""
+        return {"messages": self.run_calls(state["messages"][-1].tool_calls)}
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """
+        The same tool, run on this node's pool with its timeout, for agents that call
+        tools themselves. Only single-input Tools with a timeout are wrapped; others are
+        returned as is.
+        """
+        timeout = self._timeout(tool.name)
+        if not isinstance(tool, Tool) or timeout is None:
+            return tool
+
+        def run(tool_input: str) -> str:
+            future = self.executor.submit(self._timed, tool.name, tool.func, tool_input)
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                future.cancel()
+                return self._timeout_text(tool.name, timeout)
+
+        return Tool(name=tool.name, description=tool.description, func=run, return_direct=tool.return_direct)
+
+    def stats(self) -> dict:
+        """Latency per tool, in seconds, over its last 500 calls."""
+        with self._lock:
+            return {
+                name: dict(
+                    calls=len(samples),
+                    timeouts=self.timeout_counts.get(name, 0),
+                    median=round(statistics.median(samples), 3) if samples else None,
+                    max=round(max(samples), 3) if samples else None,
+                )
+                for name in set(self.latencies) | set(self.timeout_counts)
+                for samples in [self.latencies.get(name, ())]
+            }
+
+
+class ParallelToolAgent:
+    """
+    Tool-calling agent whose tool calls go through a ParallelToolNode, so the calls the
+    model asks for in one turn run at once instead of one after another as in
+    AgentExecutor. Invoked like an AgentExecutor: {"input": ...} -> {"output": ...,
+    "intermediate_steps": [(AgentAction, observation), ...]}.
+    """
+
+    def __init__(self, llm, tools: List[BaseTool], system_prompt: str, tool_node: ParallelToolNode,
+                 max_tool_rounds: int = 1):
+        self.llm_with_tools = llm.bind_tools(tools)
+        self.tools = {tool.name: tool for tool in tools}
+        self.system_prompt = system_prompt
+        self.tool_node = tool_node
+        self.max_tool_rounds = max_tool_rounds
+
+    def invoke(self, inputs: dict, config=None) -> dict:
+        messages = [SystemMessage(content=self.system_prompt), HumanMessage(content=inputs["input"])]
+        steps, last_round = [], []
+        for tool_round in range(self.max_tool_rounds + 1):
+            response = self.llm_with_tools.invoke(messages, config=config)
+            if not response.tool_calls:
+                return {"output": message_text(response), "intermediate_steps": steps}
+            if tool_round == self.max_tool_rounds:
+                # Out of tool rounds: further calls are dropped, and the model may have
+                # said nothing, so answer with what the tools returned
+                return {"output": self._stopped(response, last_round), "intermediate_steps": steps}
+            results = self.tool_node.run_calls(response.tool_calls, self.tools)
+            messages += [response, *results]
+            last_round = [
+                (AgentAction(tool=call["name"], tool_input=call["args"], log=""), result.content)
+                for call, result in zip(response.tool_calls, results)
+            ]
+            steps += last_round
+
+    def _stopped(self, response, last_round) -> str:
+        """The answer when the model still wants tools after its last round: what they returned."""
+        lines = [f"Stopped after {self.max_tool_rounds} tool round(s) without a final answer."]
+        if message_text(response).strip():
+            lines.append(message_text(response).strip())
+        if last_round:
+            lines.append("Last tool results:")
+            lines += [f"- {action.tool}: {str(observation)[:500]}" for action, observation in last_round]
+        return "\n".join(lines)
@@ -0,0 +1,259 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+# Route keywords with weights. Routes are QueryType values from main.py; ops questions
+# go to the llama chat node.
+DEFAULT_ROUTES: Dict[str, Dict[str, float]] = {
+    "secrets": {
+        "secret": 2, "vault": 2, "openbao": 3, "bao": 2, "credential": 2,
+        "password": 2, "token": 1, "api key": 2, "key": 1, "certificate": 1,
+        "cert": 1, "kv": 1,
+    },
+    "gitlab": {
+        "gitlab": 3, "merge request": 2, "mr": 2, "pipeline": 1, "ci/cd": 1,
+        "issue": 1.5, "repository": 1, "repo": 1, "commit": 1.5, "branch": 1.5,
+    },
+    "chat_llama": {
+        "docker": 2, "kubernetes": 2, "k8s": 2, "log": 1, "monitoring": 1,
+        "deployment": 1, "container": 1.5, "pod": 1, "service": 0.5, "cluster": 1,
+        "node": 0.5, "volume": 1, "namespace": 1, "config": 0.5, "configuration": 0.5,
+        "system": 0.5, "environment": 0.5, "infrastructure": 1, "server": 1,
+        "cloud": 1, "aws": 1, "azure": 1, "gcp": 1,
+    },
+    "code": {
+        "code": 1.5, "function": 1.5, "programming": 1.5, "debug": 1, "error": 0.5,
+        "python": 1.5, "javascript": 1.5, "java": 1.5, "cpp": 1.5, "c++": 1.5,
+        "algorithm": 1.5, "compile": 1, "syntax": 1, "git": 1, "github": 1,
+    },
+}
+
+# Tie-break order, matching the order detect_query_type used to check routes in
+DEFAULT_PRIORITY = ["secrets", "gitlab", "chat_llama", "code"]
+
+
+class KeywordRouter:
+    """
+    Route a message by weighted keyword hits, found in one pass of a single compiled
+    pattern. Keywords only match as whole words, so "key" no longer matches "keyboard"
+    and "mr" no longer matches inside other words. Word keywords longer than three
+    letters also match their plurals; shorter ones don't, so "mrs" isn't "mr".
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, Union[Dict[str, float], Iterable[str]]] = None,
+        priority: Optional[List[str]] = None,
+        min_score: float = 0.0,
+    ):
+        routes = DEFAULT_ROUTES if routes is None else routes
+        self.priority = list(priority if priority is not None else DEFAULT_PRIORITY)
+        self.priority += [route for route in routes if route not in self.priority]
+        self.min_score = min_score
+
+        # keyword -> [(route, weight)]; a keyword may count towards several routes
+        self.keywords: Dict[str, List[tuple]] = {}
+        for route, keywords in routes.items():
+            if not isinstance(keywords, dict):
+                keywords = {keyword: 1.0 for keyword in keywords}
+            for keyword, weight in keywords.items():
+                self.keywords.setdefault(self._normalize(keyword), []).append((route, weight))
+
+        alternatives = sorted(self.keywords, key=len, reverse=True)
+        pluralized = [k for k in alternatives if len(k) > 3 and re.fullmatch(r"[a-z ]+", k)]
+        exact = [k for k in alternatives if k not in pluralized]
+
+        def either(keywords):
+            return "|".join(re.escape(k).replace(r"\ ", r"\s+") for k in keywords) or "(?!)"
+
+        # Matched against lowercased text: cheaper than re.IGNORECASE on every alternative
+        self.pattern = re.compile(rf"(?<!\w)(?:({either(pluralized)})(?:e?s)?|({either(exact)}))(?!\w)")
+
+    @staticmethod
+    def _normalize(keyword: str) -> str:
+        return " ".join(keyword.lower().split())
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Total keyword weight per route."""
+        scores: Dict[str, float] = {}
+        for plural, exact in self.pattern.findall(text.lower()):
+            keyword = plural or exact
+            hits = self.keywords.get(keyword) or self.keywords[self._normalize(keyword)]
+            for route, weight in hits:
+                scores[route] = scores.get(route, 0.0) + weight
+        return scores
+
+    def best(self, scores: Dict[str, float]) -> Optional[str]:
+        """Highest scoring route, ties going to the route earliest in priority."""
+        best = None
+        for route in self.priority:
+            score = scores.get(route, 0.0)
+            if score > self.min_score and (best is None or score > scores[best]):
+                best = route
+        return best
+
+    def route(self, text: str) -> Optional[str]:
+        """The route for text, or None when no keyword matched."""
+        return self.best(self.scores(text))
+
+
+# Example prompts the semantic router builds each route's centroid from. "chat" has no
+# route of its own: it stands for general questions, which detect_query_type alternates.
+DEFAULT_EXAMPLES: Dict[str, List[str]] = {
+    "secrets": [
+        "read the database password from vault",
+        "store this api key as a secret",
+        "rotate the credentials for the service account",
+        "list the secrets under the kv path",
+        "delete the old token from openbao",
+    ],
+    "gitlab": [
+        "list the open merge requests",
+        "show me the issues assigned to me",
+        "what changed in the last few commits",
+        "create a branch for the new feature",
+        "why did the ci pipeline fail",
+    ],
+    "chat_llama": [
+        "why is my container running out of memory",
+        "show the logs of the synapse container",
+        "restart the nginx service",
+        "which containers are using the most cpu",
+        "is the kubernetes cluster healthy",
+        "why does the deployment keep crashing",
+    ],
+    "code": [
+        "write a function that parses container logs",
+        "fix this python error",
+        "refactor this class to use dependency injection",
+        "explain what this regular expression does",
+        "write a unit test for this method",
+        "implement a binary search in javascript",
+    ],
+    "chat": [
+        "what's the weather like today",
+        "tell me a joke",
+        "summarize the history of the roman empire",
+        "recommend a good book",
+        "how are you doing",
+    ],
+}
+
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
+
+
+class OllamaEmbedder:
+    """Embed a batch of texts with the local Ollama /api/embed endpoint."""
+
+    def __init__(self, model: str = "nomic-embed-text", base_url: str = OLLAMA_API_URL, timeout: float = 5.0):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        import requests
+
+        response = requests.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.model, "input": texts},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+
+class SemanticRouter:
+    """
+    Route by cosine similarity between the message's embedding and each route's centroid
+    of example prompt embeddings. The keyword router answers alone when its top route
+    leads the runner-up by at least keyword_margin, so most messages never reach the
+    embedder; when embedding fails the keyword route is used, and the embedder isn't
+    tried again for retry_seconds so a down Ollama doesn't stall every routing call.
+
+    embed is any callable mapping a list of texts to a list of vectors; Ollama by default.
+    """
+
+    def __init__(
+        self,
+        keyword_router: Optional[KeywordRouter] = None,
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        examples: Optional[Dict[str, List[str]]] = None,
+        keyword_margin: float = 2.0,
+        min_similarity: float = 0.3,
+        cache_size: int = 1024,
+        retry_seconds: float = 60.0,
+    ):
+        self.keyword_router = keyword_router or KeywordRouter()
+        self.embed = embed or OllamaEmbedder()
+        self.examples = examples if examples is not None else DEFAULT_EXAMPLES
+        self.keyword_margin = keyword_margin
+        self.min_similarity = min_similarity
+        self.cache_size = cache_size
+        self.retry_seconds = retry_seconds
+        self._down_until = 0.0
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        self._routes: Optional[List[str]] = None
+        self._centroids = None  # routes x dimensions, unit rows
+
+    def _vectors(self, texts: List[str]):
+        """Unit-length embeddings for texts, served from the LRU cache where possible."""
+        import numpy as np
+
+        missing = [text for text in dict.fromkeys(texts) if text not in self._cache]
+        if missing:
+            vectors = np.asarray(self.embed(missing), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for text, vector in zip(missing, vectors):
+                self._cache[text] = vector
+        for text in texts:
+            self._cache.move_to_end(text)
+        result = np.stack([self._cache[text] for text in texts])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _build_centroids(self):
+        import numpy as np
+
+        routes = [route for route, prompts in self.examples.items() if prompts]
+        prompts = [prompt for route in routes for prompt in self.examples[route]]
+        # Example embeddings are computed once, so keep them out of the message cache
+        vectors = np.asarray(self.embed(prompts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroids, start = [], 0
+        for route in routes:
+            end = start + len(self.examples[route])
+            centroids.append(vectors[start:end].mean(axis=0))
+            start = end
+        centroids = np.stack(centroids)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self._routes, self._centroids = routes, centroids
+
+    def similarities(self, text: str) -> Dict[str, float]:
+        """Cosine similarity of text to every route centroid."""
+        if self._centroids is None:
+            self._build_centroids()
+        similarity = self._centroids @ self._vectors([text])[0]
+        return dict(zip(self._routes, similarity.tolist()))
+
+    def route(self, text: str) -> Optional[str]:
+        """The route for text, or None for general chat."""
+        scores = self.keyword_router.scores(text)
+        keyword_route = self.keyword_router.best(scores)
+        ranked = sorted(scores.values(), reverse=True) + [0.0, 0.0]
+        if keyword_route is not None and ranked[0] - ranked[1] >= self.keyword_margin:
+            return keyword_route
+        if time.monotonic() < self._down_until:
+            return keyword_route
+        try:
+            similarities = self.similarities(text)
+        except Exception as e:
+            self._down_until = time.monotonic() + self.retry_seconds
+            print(f"Semantic routing unavailable for {self.retry_seconds:g}s, using keywords: {e}")
+            return keyword_route
+        route = max(similarities, key=similarities.get)
+        if similarities[route] < self.min_similarity or route not in self.keyword_router.priority:
+            return None
+        return route
@@ -6,6 +6,9 @@ import time
 import os
 import sys
 import utils_docker
+import utils_edge
+import utils_models
+import utils_synapse
 import json
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -16,9 +19,34 @@ util.initializeFiles()
 print("Reading env.py")
 import env
 
+if len(sys.argv) > 1 and sys.argv[1] == "logs":
+    import utils_logs
+
+    utils_logs.main(sys.argv[2:], env)
+    sys.exit(0)
+
+if len(sys.argv) > 1 and sys.argv[1] == "refresh":
+    print(json.dumps(env.refresh_facts(), indent=2))
+    sys.exit(0)
+
+if len(sys.argv) > 1 and sys.argv[1] in ("bundle", "load"):
+    import utils_bundle
+
+    bundle_dir = sys.argv[2] if len(sys.argv) > 2 else utils_bundle.BUNDLE_DIR
+    if sys.argv[1] == "bundle":
+        utils_bundle.bundle(env, bundle_dir)
+    else:
+        utils_bundle.load(bundle_dir)
+    sys.exit(0)
+
+if "synapse" in env.SERVICES_TO_RUN:
+    # Before rendering, so homeserver.yaml is written (and Synapse restarted) only when
+    # the tuning actually changes
+    utils_synapse.tune_synapse(env)
+
 print("Applying env var substitutions in hard-coded .template files")
-util.substitutions(here, env)
-util.writeViteEnv(vars(env))
+changed = util.substitutions(here, env)
+changed += util.writeViteEnv(vars(env))
 
 if not os.path.isdir(env.keys_dir):
     if env.USER_WEBSITE == "localhost":
@@ -31,6 +59,16 @@ config = vars(env)
 # make sure the network is up
 utils_docker.ensure_network(env.NETWORK_NAME)
 
+# Restart running containers whose rendered config changed. The web app (Vite/nodemon)
+# and org (air) pick up file changes themselves.
+utils_docker.restart_changed(changed, env.container_configs(), skip=("webapp", "org"))
+
+# preload images from an offline bundle (run.py bundle) instead of pulling them
+if os.path.isfile(os.path.join(here, "bundle", "manifest.json")):
+    import utils_bundle
+
+    utils_bundle.load()
+
 # create the keycloak keys if they dont exist
 if not os.path.isdir("certs/keys"):
     os.system("cd certs && ./init-temp-keys.sh")
@@ -38,8 +76,20 @@ if not os.path.isdir("certs/keys"):
 # --- KEYCLOAK ---
 if "keycloak" in env.SERVICES_TO_RUN:
     utils_docker.run_container(env.keycloakdb)
+    # build the optimized image while the database comes up
+    for replica in env.keycloak_replicas:
+        utils_docker.use_optimized_keycloak(
+            replica, os.path.join(env.keycloak_dir, "oauth_certs")
+        )
     utils_docker.wait_for_db(network=env.NETWORK_NAME, db_url="keycloakdb:5432")
     utils_docker.run_container(env.keycloak)
+    if len(env.keycloak_replicas) > 1:
+        # let the first replica import the realms before the others join the cluster
+        utils_docker.wait_for_url(
+            f"http://{env.keycloak['name']}:8888/auth/realms/master", network=env.NETWORK_NAME
+        )
+        for replica in env.keycloak_replicas[1:]:
+            utils_docker.run_container(replica)
 
 # --- WEB APP ---
 # theoretically has no dependencies
@@ -57,6 +107,8 @@ if "nginx" in env.SERVICES_TO_RUN:
             pass
             #utils_docker.generateProdKeys(outdir=env.certs_dir, website=env.USER_WEBSITE)
     utils_docker.run_container(env.nginx)
+    if env.DENSITY_MODE:
+        utils_edge.ensure_edge(env)
 
 # --- OPENTDF ---
 if "opentdf" in env.SERVICES_TO_RUN:
@@ -73,8 +125,14 @@ if "org" in env.SERVICES_TO_RUN:
 # --- MATRIX SYNAPSE ---
 if "synapse" in env.SERVICES_TO_RUN:
     utils_docker.run_container(env.synapsedb)
+    changed = utils_synapse.write_worker_configs(env)
+    utils_docker.restart_changed(changed, [env.synapse] + env.synapse_workers)
+    if env.SYNAPSE_WORKERS:
+        utils_docker.run_container(env.synapse_redis)
     utils_docker.wait_for_db(network=env.NETWORK_NAME, db_url="synapsedb:5432")
     utils_docker.run_container(env.synapse)
+    for worker in env.synapse_workers:
+        utils_docker.run_container(worker)
 
 if "element" in env.SERVICES_TO_RUN:
     # --- Element web app ---
@@ -83,6 +141,7 @@ if "element" in env.SERVICES_TO_RUN:
 # --- OLLAMA !!! ---
 if "ollama" in env.SERVICES_TO_RUN:
     utils_docker.run_container(env.ollama)
+    utils_models.enforce_budget(env)
     utils_docker.pullModels(env.MODELS_TO_PULL,env.NETWORK_NAME)
     utils_docker.run_container(env.deepseek_janus)
 
@@ -0,0 +1,287 @@
+"""
+Serve the multi-LLM graph to many users at once over SSE and WebSocket.
+
+    python server.py [--host 0.0.0.0] [--port 8080]
+
+POST /sessions                    -> {"session_id": ...}; a user's sessions share one
+                                  conversation. The user comes from the proxy's
+                                  X-Forwarded-User header; {"user": ...} in the body is
+                                  only honoured with ALLOW_CLIENT_USER set (no proxy)
+POST /sessions/{id}/messages      {"message": ...} -> text/event-stream of token,
+                                  message and end events as the models produce them
+DELETE /sessions/{id}/runs        cancel the session's running requests
+GET /sessions/{id}/ws             WebSocket: send {"type": "message", "content": ...}
+                                  or {"type": "cancel"}; replies arrive as JSON
+GET /metrics                      time to first token per node
+POST /gitlab/webhook              GitLab issue, merge request, note and push hooks, applied
+                                  to the local mirror (X-Gitlab-Token must match
+                                  GITLAB_WEBHOOK_SECRET)
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from uuid import uuid4
+
+from aiohttp import web, WSMsgType
+from langchain_core.messages import HumanMessage
+
+import checkpoints
+from streaming import FirstTokenTimer, token_events
+
+# Requests one session may have in flight; more get 429 (SSE) or an error (WebSocket)
+SESSION_CONCURRENCY = int(os.environ.get("SESSION_CONCURRENCY", 1))
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", 3600))
+COMPACT_INTERVAL_SECONDS = int(os.environ.get("COMPACT_INTERVAL_SECONDS", 3600))
+# Only for running without an authenticating proxy: lets clients name their own user
+ALLOW_CLIENT_USER = bool(os.environ.get("ALLOW_CLIENT_USER"))
+
+
+class Session:
+    """A client connection to a graph thread, plus the requests it has running."""
+
+    def __init__(self, session_id: str, thread_id: str, semaphore: asyncio.Semaphore):
+        self.id = session_id
+        self.thread_id = thread_id
+        # Shared by every session on the thread, so a user's tabs can't interleave turns
+        self.semaphore = semaphore
+        self.tasks = set()
+        self.last_used = time.monotonic()
+
+    def cancel(self) -> int:
+        for task in self.tasks:
+            task.cancel()
+        return len(self.tasks)
+
+
+class ChatServer:
+    def __init__(self, graph):
+        self.graph = graph
+        self.sessions = {}
+        self.thread_semaphores = {}
+        self.first_token_timer = FirstTokenTimer()
+
+    def _session(self, request) -> Session:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text="Unknown session")
+        session.last_used = time.monotonic()
+        return session
+
+    def _expire_sessions(self):
+        cutoff = time.monotonic() - SESSION_IDLE_SECONDS
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not session.tasks:
+                del self.sessions[session_id]
+        in_use = {session.thread_id for session in self.sessions.values()}
+        for thread_id in list(self.thread_semaphores):
+            if thread_id not in in_use:
+                del self.thread_semaphores[thread_id]
+
+    async def run(self, session: Session, content: str):
+        """Stream (kind, node, text) for one user message on the session's thread."""
+        config = {
+            "configurable": {
+                "thread_id": session.thread_id,
+                "checkpoint_ns": "chat_interaction",
+            },
+            "callbacks": [self.first_token_timer],
+        }
+        state = {"messages": [HumanMessage(content=content)], "query_type": ""}
+        streamed_nodes = set()
+        async for event in self.graph.astream(state, config=config, stream_mode=["messages", "updates"]):
+            for reply in token_events(event, streamed_nodes):
+                yield reply
+
+    async def gitlab_webhook(self, request):
+        secret = os.environ.get("GITLAB_WEBHOOK_SECRET")
+        if not secret or request.headers.get("X-Gitlab-Token") != secret:
+            raise web.HTTPForbidden(text="Bad or missing X-Gitlab-Token")
+        from tool_gitlab import get_gitlab_mirror
+
+        payload = await request.json()
+        mirror = await asyncio.to_thread(get_gitlab_mirror)
+        if mirror is None:
+            raise web.HTTPNotFound(text="The GitLab mirror is disabled")
+        kind = await asyncio.to_thread(mirror.ingest_webhook, payload)
+        return web.json_response({"applied": kind})
+
+    async def metrics(self, request):
+        return web.json_response({"first_token": self.first_token_timer.summary()})
+
+    async def create_session(self, request):
+        self._expire_sessions()
+        body = await request.json() if request.can_read_body else {}
+        # The proxy's header is the only trusted identity; anyone can put a user in the body
+        user = request.headers.get("X-Forwarded-User")
+        if user and body.get("user") and body["user"] != user:
+            raise web.HTTPForbidden(text="user doesn't match the authenticated user")
+        if not user and ALLOW_CLIENT_USER:
+            user = body.get("user")
+        session_id = str(uuid4())
+        # Anonymous sessions get a conversation of their own
+        thread_id = checkpoints.thread_id_for(user) if user else session_id
+        semaphore = self.thread_semaphores.setdefault(thread_id, asyncio.Semaphore(SESSION_CONCURRENCY))
+        session = Session(session_id, thread_id, semaphore)
+        self.sessions[session.id] = session
+        return web.json_response({"session_id": session.id})
+
+    async def cancel_runs(self, request):
+        session = self._session(request)
+        return web.json_response({"cancelled": session.cancel()})
+
+    async def post_message(self, request):
+        session = self._session(request)
+        body = await request.json()
+        content = body.get("message", "").strip()
+        if not content:
+            raise web.HTTPBadRequest(text="message is required")
+        if session.semaphore.locked():
+            raise web.HTTPTooManyRequests(text="This session already has a request running")
+
+        async with session.semaphore:
+            response = web.StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",  # nginx must not buffer the stream
+                }
+            )
+            await response.prepare(request)
+            task = asyncio.current_task()
+            session.tasks.add(task)
+            try:
+                async for kind, node, text in self.run(session, content):
+                    data = json.dumps({"node": node, "content": text})
+                    await response.write(f"event: {kind}\ndata: {data}\n\n".encode())
+                await response.write(b"event: done\ndata: {}\n\n")
+            except asyncio.CancelledError:
+                # DELETE .../runs, or the client went away
+                if not request.transport or request.transport.is_closing():
+                    raise
+                await response.write(b"event: cancelled\ndata: {}\n\n")
+            except ConnectionResetError:
+                pass
+            except Exception as e:
+                print(f"Error in session {session.id}: {e}")
+                data = json.dumps({"error": str(e)})
+                await response.write(f"event: error\ndata: {data}\n\n".encode())
+            finally:
+                session.tasks.discard(task)
+            return response
+
+    async def websocket(self, request):
+        session = self._session(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+
+        async def answer(content):
+            async with session.semaphore:
+                try:
+                    async for kind, node, text in self.run(session, content):
+                        await ws.send_json({"type": kind, "node": node, "content": text})
+                    await ws.send_json({"type": "done"})
+                except asyncio.CancelledError:
+                    if not ws.closed:
+                        await ws.send_json({"type": "cancelled"})
+                except Exception as e:
+                    print(f"Error in session {session.id}: {e}")
+                    if not ws.closed:
+                        await ws.send_json({"type": "error", "error": str(e)})
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    await ws.send_json({"type": "error", "error": "Invalid JSON"})
+                    continue
+                session.last_used = time.monotonic()
+                if data.get("type") == "cancel":
+                    session.cancel()
+                elif data.get("type") == "message" and data.get("content"):
+                    if session.semaphore.locked():
+                        await ws.send_json(
+                            {"type": "error", "error": "This session already has a request running"}
+                        )
+                        continue
+                    task = asyncio.create_task(answer(data["content"]))
+                    session.tasks.add(task)
+                    task.add_done_callback(session.tasks.discard)
+        finally:
+            # Nobody is left to read the answers
+            session.cancel()
+        return ws
+
+
+def create_app(graph) -> web.Application:
+    server = ChatServer(graph)
+    app = web.Application()
+    app["chat_server"] = server
+    app.add_routes(
+        [
+            web.get("/health", lambda request: web.json_response({"status": "ok"})),
+            web.get("/metrics", server.metrics),
+            web.post("/sessions", server.create_session),
+            web.post("/sessions/{session_id}/messages", server.post_message),
+            web.delete("/sessions/{session_id}/runs", server.cancel_runs),
+            web.get("/sessions/{session_id}/ws", server.websocket),
+            web.post("/gitlab/webhook", server.gitlab_webhook),
+        ]
+    )
+    return app
+
+
+async def _compact_periodically(app):
+    async def loop():
+        while True:
+            try:
+                result = await asyncio.to_thread(checkpoints.compact)
+                print(f"Compacted checkpoints: {result}")
+            except Exception as e:
+                # e.g. "database is locked"; try again next interval
+                print(f"Error compacting checkpoints: {e}")
+            await asyncio.sleep(COMPACT_INTERVAL_SECONDS)
+
+    task = asyncio.create_task(loop())
+    yield
+    task.cancel()
+
+
+async def serve() -> web.Application:
+    """Build the graph on the server's event loop, checkpointing to SQLite."""
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    import main as chat
+
+    chat.load_env()
+    chat.configure_router()
+    saver_context = AsyncSqliteSaver.from_conn_string(checkpoints.CHECKPOINT_DB)
+    saver = await saver_context.__aenter__()
+    graph = chat.build_graph(
+        checkpointer=saver, store=checkpoints.open_store(), cache=chat.create_response_cache()
+    )
+    app = create_app(graph)
+    app.cleanup_ctx.append(_compact_periodically)
+
+    async def close_saver(app):
+        await saver_context.__aexit__(None, None, None)
+
+    app.on_cleanup.append(close_saver)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    web.run_app(serve(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import statistics
+import time
+from typing import Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, BaseMessageChunk, RemoveMessage
+
+
+def message_text(message) -> str:
+    """Text of a message or chunk; Anthropic content arrives as a list of blocks."""
+    if isinstance(message, tuple):
+        return message[1]
+    if not isinstance(message, BaseMessage):
+        return str(message)
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+    )
+
+
+def token_events(graph_event, streamed_nodes: set):
+    """
+    Turn one item from graph.stream(..., stream_mode=["messages", "updates"]) into
+    ("token", node, text) and ("message", node, text) tuples, plus ("end", node, "")
+    once a node that streamed has finished. Whole messages are only emitted for nodes
+    that didn't stream tokens (cache hits, GitLab results, errors), so nothing is
+    shown twice.
+    """
+    mode, payload = graph_event
+    if mode == "messages":
+        chunk, metadata = payload
+        # Newer langgraph also emits each node's finished messages here; updates has them
+        if not isinstance(chunk, BaseMessageChunk):
+            return
+        text = message_text(chunk)
+        if text:
+            node = metadata.get("langgraph_node", "")
+            streamed_nodes.add(node)
+            yield "token", node, text
+    elif mode == "updates":
+        for node, value in payload.items():
+            if not isinstance(value, dict) or not value.get("messages"):
+                continue
+            if isinstance(value["messages"][-1], RemoveMessage):
+                continue  # the context node trimming history
+            if node in streamed_nodes:
+                streamed_nodes.discard(node)
+                yield "end", node, ""
+                continue
+            yield "message", node, message_text(value["messages"][-1])
+
+
+class FirstTokenTimer(BaseCallbackHandler):
+    """Time from each chat model call starting to its first streamed token, per graph node."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = {}
+        self.samples: Dict[str, List[float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.started[run_id] = (time.perf_counter(), (metadata or {}).get("langgraph_node", ""))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            start, node = started
+            self.samples.setdefault(node, []).append(time.perf_counter() - start)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+
+    def summary(self) -> dict:
+        return {
+            node: dict(
+                count=len(samples),
+                median_seconds=round(statistics.median(samples), 3),
+                max_seconds=round(max(samples), 3),
+            )
+            for node, samples in self.samples.items()
+        }
@@ -0,0 +1,61 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import add_messages
+
+from context_window import ContextManager, estimate_tokens
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        return AIMessage(content="summary")
+
+
+def manager(summarizer, budget=500, keep_turns=2):
+    return ContextManager(summarizer, route=lambda state: "code", budgets={"code": budget}, keep_turns=keep_turns)
+
+
+def test_oversized_recent_turns_are_truncated_to_budget():
+    log = "line of container output\n" * 2000
+    messages = add_messages([], [
+        HumanMessage(content="show me the logs"),
+        AIMessage(content=log),
+        HumanMessage(content="why did it crash?"),
+    ])
+    summarizer = FakeSummarizer()
+
+    update = manager(summarizer).process_state({"messages": messages, "summary": ""})
+
+    # Both turns are within keep_turns, so nothing is summarized; the log is cut instead
+    assert summarizer.calls == 0
+    assert [message.id for message in update["messages"]] == [messages[1].id]
+    trimmed = add_messages(messages, update["messages"])
+    assert estimate_tokens(trimmed) <= 500
+    assert "characters trimmed" in trimmed[1].content
+    assert trimmed[1].content.startswith("line of container output")
+    assert trimmed[-1].content == "why did it crash?"
+
+
+def test_truncation_applies_after_summarizing_older_turns():
+    messages = add_messages([], [
+        HumanMessage(content="first question"),
+        AIMessage(content="first answer " * 200),
+        HumanMessage(content="paste"),
+        ToolMessage(content="x" * 20000, tool_call_id="1"),
+        HumanMessage(content="and now?"),
+    ])
+    summarizer = FakeSummarizer()
+
+    update = manager(summarizer).process_state({"messages": messages, "summary": ""})
+
+    assert summarizer.calls == 1
+    trimmed = add_messages(messages, update["messages"])
+    assert [message.content for message in trimmed][0] == "paste"
+    assert estimate_tokens(trimmed) + len(update["summary"]) // 4 <= 500
+
+
+def test_within_budget_is_left_alone():
+    messages = add_messages([], [HumanMessage(content="hi"), AIMessage(content="hello")])
+    assert manager(FakeSummarizer()).process_state({"messages": messages, "summary": ""}) == {}
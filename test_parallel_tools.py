@@ -0,0 +1,41 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import Tool
+
+from parallel_tools import ParallelToolAgent, ParallelToolNode
+
+
+class FakeToolModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def tool_call(name, call_id):
+    return {"name": name, "args": {"tool_input": "x"}, "id": call_id}
+
+
+def test_agent_reports_last_tool_results_when_out_of_rounds():
+    docker_ps = Tool(name="docker_ps", description="List containers", func=lambda _: "nginx running")
+    # The model asks for tools in every turn and never answers
+    model = FakeToolModel(messages=iter([
+        AIMessage(content="", tool_calls=[tool_call("docker_ps", "1")]),
+        AIMessage(content="", tool_calls=[tool_call("docker_ps", "2")]),
+    ]))
+    agent = ParallelToolAgent(model, [docker_ps], "system", ParallelToolNode([docker_ps]), max_tool_rounds=1)
+
+    result = agent.invoke({"input": "what is running?"})
+
+    assert result["output"].startswith("Stopped after 1 tool round(s)")
+    assert "- docker_ps: nginx running" in result["output"]
+    assert [action.tool for action, _ in result["intermediate_steps"]] == ["docker_ps"]
+
+
+def test_agent_answers_after_tool_round():
+    docker_ps = Tool(name="docker_ps", description="List containers", func=lambda _: "nginx running")
+    model = FakeToolModel(messages=iter([
+        AIMessage(content="", tool_calls=[tool_call("docker_ps", "1")]),
+        AIMessage(content="nginx is running"),
+    ]))
+    agent = ParallelToolAgent(model, [docker_ps], "system", ParallelToolNode([docker_ps]))
+
+    assert agent.invoke({"input": "what is running?"})["output"] == "nginx is running"
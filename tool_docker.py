@@ -1,6 +1,7 @@
 import docker
 import json
 import os
+import utils_logs
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Any, List, Type
 from langchain.tools import Tool
@@ -110,22 +111,30 @@ class DockerTools:
         try:
             container = self.client.containers.get(container_name)
 
-            # Get logs with timestamp
+            # Get logs with timestamp, straight from the json-file log when we can read it
             since = datetime.utcnow() - timedelta(minutes=time_range_minutes)
-            logs = container.logs(
+            until = datetime.utcnow()
+            lines = utils_logs.json_log_records(
+                container.attrs,
                 since=since,
-                until=datetime.utcnow(),
-                timestamps=True,
-                tail=max_lines
-            ).decode('utf-8')
+                until=until,
+                max_lines=max_lines
+            )
+            if lines is None:
+                lines = container.logs(
+                    since=since,
+                    until=until,
+                    timestamps=True,
+                    tail=max_lines
+                ).decode('utf-8').split('\n')
 
             # Apply filters if specified
             if filters:
-                filtered_logs = []
-                for line in logs.split('\n'):
-                    if all(value.lower() in line.lower() for value in filters.values()):
-                        filtered_logs.append(line)
-                logs = '\n'.join(filtered_logs)
+                lines = (
+                    line for line in lines
+                    if all(value.lower() in line.lower() for value in filters.values())
+                )
+            logs = '\n'.join(lines)
 
             # Analyze logs
             analysis = self._extract_log_patterns(logs)
@@ -200,6 +209,17 @@ class DockerTools:
 
         return False
 
+    def state_fingerprint(self) -> str:
+        """
+        Which containers exist, from which images and in which state. Answers the docker
+        tools gave are only reusable while this is unchanged.
+        """
+        try:
+            containers = self.client.api.containers(all=True)
+        except Exception as e:
+            return f"unavailable: {type(e).__name__}"
+        return ";".join(sorted(f"{c['Id']}:{c['ImageID']}:{c['State']}" for c in containers))
+
     def create_network(self, networkName):
         """Create Docker network if not exists"""
         if not self.client.networks.get(networkName):
@@ -215,9 +235,9 @@ class DockerTools:
         os.system(cmd)
 
 
-def create_docker_tools() -> List[Tool]:
+def create_docker_tools(docker_tools: Optional[DockerTools] = None) -> List[Tool]:
     """Create and return a list of Docker-related tools."""
-    docker_tools = DockerTools()
+    docker_tools = docker_tools or DockerTools()
 
     tools = [
         Tool(
@@ -0,0 +1,256 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+
+import requests
+from langchain_core.tools import Tool
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+class ETagCachingAdapter(HTTPAdapter):
+    """
+    Connection-pooling adapter that revalidates GET responses with If-None-Match and
+    answers 304s from its own copy, so unchanged lists and files cost a round trip on a
+    warm connection instead of a full payload.
+    """
+
+    def __init__(self, max_entries: int = 512, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # url -> (etag, headers, content)
+        self.stats = dict(fetched=0, revalidated=0, uncached=0)
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        with self._lock:
+            cached = self.entries.get(request.url)
+        if cached is not None:
+            request.headers["If-None-Match"] = cached[0]
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self.entries.move_to_end(request.url)
+                self.stats["revalidated"] += 1
+            return self._cached_response(request, response, cached)
+        etag = response.headers.get("ETag")
+        with self._lock:
+            if response.status_code == 200 and etag:
+                self.entries[request.url] = (etag, dict(response.headers), response.content)
+                self.entries.move_to_end(request.url)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                self.stats["fetched"] += 1
+            else:
+                self.entries.pop(request.url, None)
+                self.stats["uncached"] += 1
+        return response
+
+    @staticmethod
+    def _cached_response(request, not_modified, cached):
+        etag, headers, content = cached
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        response.headers.update(not_modified.headers)
+        response.headers.pop("Content-Length", None)
+        response._content = content
+        response.url = request.url
+        response.request = request
+        response.connection = not_modified.connection
+        response.encoding = not_modified.encoding or requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+
+# Seconds to wait on GitLab before giving up, so a hung server can't block reads forever
+GITLAB_TIMEOUT = float(os.environ.get("GITLAB_TIMEOUT", 15))
+
+_api = None
+_api_lock = threading.Lock()
+_mirror = None
+
+
+def create_session(max_entries: int = 512) -> requests.Session:
+    """A keep-alive session whose GETs go through the ETag cache."""
+    session = requests.Session()
+    adapter = ETagCachingAdapter(max_entries=max_entries, pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_gitlab_api():
+    """
+    The GitLabAPIWrapper shared by every GitLab tool, created (and authenticated) on
+    first use over one pooled, ETag-caching session.
+    """
+    global _api
+    with _api_lock:
+        if _api is None:
+            import gitlab
+            from langchain_community.utilities.gitlab import GitLabAPIWrapper
+
+            url = os.environ.get("GITLAB_URL", "https://gitlab.com")
+            token = os.environ["GITLAB_PERSONAL_ACCESS_TOKEN"]
+            repository = os.environ["GITLAB_REPOSITORY"]
+            client = gitlab.Gitlab(
+                url=url, private_token=token, keep_base_url=True, session=create_session(), timeout=GITLAB_TIMEOUT
+            )
+            client.auth()
+            # Built directly: the wrapper's validator would open a client of its own
+            _api = GitLabAPIWrapper.model_construct(
+                gitlab=client,
+                gitlab_repo_instance=client.projects.get(repository),
+                gitlab_url=url,
+                gitlab_repository=repository,
+                gitlab_personal_access_token=token,
+                gitlab_branch=os.environ.get("GITLAB_BRANCH", "main"),
+                gitlab_base_branch=os.environ.get("GITLAB_BASE_BRANCH", "main"),
+            )
+        return _api
+
+
+def get_gitlab_mirror():
+    """
+    The local mirror reads are answered from, or None with GITLAB_MIRROR=0. Started on
+    first use: an initial sync, then polling in the background.
+    """
+    global _mirror
+    if os.environ.get("GITLAB_MIRROR", "1") == "0":
+        return None
+    api = get_gitlab_api()
+    with _api_lock:
+        if _mirror is None:
+            from gitlab_mirror import GitLabMirror
+
+            _mirror = GitLabMirror(api.gitlab_repo_instance)
+            _mirror.start_polling()
+        return _mirror
+
+
+def gitlab_action(mode: str):
+    """Tool function running one GitLabAPIWrapper mode on the shared client."""
+
+    def run(instructions: str) -> str:
+        return get_gitlab_api().run(mode, instructions)
+
+    return run
+
+
+def _list_issues(instructions: str) -> str:
+    mirror = get_gitlab_mirror()
+    return mirror.list_issues() if mirror else get_gitlab_api().run("get_issues", "")
+
+
+def _get_issue(instructions: str) -> str:
+    mirror = get_gitlab_mirror()
+    if mirror is None:
+        return get_gitlab_api().run("get_issue", instructions)
+    try:
+        return mirror.get_issue(int(instructions.strip().lstrip("#")))
+    except ValueError:
+        return "Input should be an issue number"
+
+
+def _mirrored_write(mode: str, refresh):
+    """Write through the API, then bring the mirror up to date with the result."""
+
+    def run(instructions: str) -> str:
+        result = get_gitlab_api().run(mode, instructions)
+        mirror = get_gitlab_mirror()
+        if mirror is not None and not result.startswith("Unable"):
+            try:
+                refresh(mirror, instructions)
+            except Exception as e:
+                print(f"GitLab mirror not updated after {mode}: {e}")
+        return result
+
+    return run
+
+
+def _mirror_read(method: str):
+    def run(instructions: str) -> str:
+        mirror = get_gitlab_mirror()
+        if mirror is None:
+            return "The GitLab mirror is disabled (GITLAB_MIRROR=0)"
+        return getattr(mirror, method)(query=instructions.strip())
+
+    return run
+
+
+def create_gitlab_tools() -> List[Tool]:
+    """GitLab tools for the chat agents and the GitLab node, all sharing one client."""
+    return [
+        Tool(
+            name="list_issues",
+            description="List all open issues in the repository. Returns issue titles and numbers.",
+            func=_list_issues
+        ),
+
+        Tool(
+            name="get_issue",
+            description="Get details about a specific issue including its title, body, and first 10 comments. Input should be an issue number.",
+            func=_get_issue
+        ),
+
+        Tool(
+            name="comment_on_issue",
+            description="Add a comment to a specific issue. Input format should be: 'issue_number\\n\\ncomment_text'",
+            func=_mirrored_write(
+                "comment_on_issue", lambda mirror, x: mirror.refresh_issue(int(x.split("\n", 1)[0].strip()))
+            )
+        ),
+
+        Tool(
+            name="list_merge_requests",
+            description="List open merge requests. Input is optional words to filter them by (title, description or comments).",
+            func=_mirror_read("list_merge_requests")
+        ),
+
+        Tool(
+            name="list_branches",
+            description="List branches with their latest commit. Input is optional text the branch name must contain.",
+            func=_mirror_read("list_branches")
+        ),
+
+        Tool(
+            name="search_gitlab",
+            description="Full-text search of issue and merge request titles, descriptions and comments. Input is the words to search for.",
+            func=_mirror_read("search")
+        ),
+
+        Tool(
+            name="create_file",
+            description="Create a new file in the repository. Input format should be: 'file_path\\nfile_contents'",
+            func=gitlab_action("create_file")
+        ),
+
+        Tool(
+            name="create_pull_request",
+            description="Create a new pull request. Input format should be: 'PR_title\\nPR_body'",
+            func=_mirrored_write("create_pull_request", lambda mirror, x: mirror.sync())
+        ),
+
+        Tool(
+            name="read_file",
+            description="Read the contents of a file from the repository. Input should be the file path.",
+            func=gitlab_action("read_file")
+        ),
+
+        Tool(
+            name="update_file",
+            description="Update an existing file. Input format should be: 'file_path\\nOLD <<<<\\nold_content\\n>>>> OLD\\nNEW <<<<\\nnew_content\\n>>>> NEW'",
+            func=gitlab_action("update_file")
+        ),
+
+        Tool(
+            name="delete_file",
+            description="Delete a file from the repository. Input should be the file path.",
+            func=gitlab_action("delete_file")
+        )
+    ]
@@ -1,4 +1,7 @@
+import hashlib
+import json
 import os
+import re
 import sys
 import shutil
 import subprocess
@@ -6,56 +9,210 @@ import subprocess
 
 here = os.path.abspath(os.path.dirname(__file__))
 
+def write_if_changed(path, text):
+    """
+    Write text to path through a temp file and rename, unless path already holds exactly
+    that text. Leaving unchanged files alone keeps file watchers (nodemon, air, Vite) quiet.
+    Returns True if the file was written.
+    """
+    try:
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+    return True
+
+
 def writeViteEnv(env, output_file=os.path.join(here, "webapp", ".env")):
+    """
+    Write the web app's .env, returning [output_file] if it changed. Vite only exposes
+    VITE_ variables to the app, so only those are written. Values dotenv would misread
+    are quoted: multi-line ones in double quotes with escaped newlines (the only quotes
+    dotenv expands \\n in), others in whichever quote they don't contain.
+    """
     print("Writing environment file for web app")
-    # Open the file for writing
-    with open(output_file, "w") as f:
-        for key, value in env.items():
-            if not key.startswith("__") and isinstance(value, (str, int, float)):
-                f.write(f"{key}={value}\n")
 
+    def dotenv_value(value):
+        value = str(value)
+        if not any(c in value for c in "\n\r\"'`# "):
+            return value
+        if "\n" in value or "\r" in value:
+            escaped = value.replace("\r", "").replace("\n", "\\n").replace('"', '\\"')
+            return f'"{escaped}"'
+        quote = next((q for q in "\"'`" if q not in value), '"')
+        return f"{quote}{value}{quote}"
+
+    text = "".join(
+        f"{key}={dotenv_value(value)}\n"
+        for key, value in env.items()
+        if key.startswith("VITE_") and isinstance(value, (str, int, float))
+    )
+    if not write_if_changed(output_file, text):
+        print(f"{output_file} is unchanged")
+        return []
     print(f"Environment variables have been written to {output_file}")
+    return [output_file]
+
+
+def nginx_upstream(name, servers, port, balance=None, server_params=""):
+    """Render an nginx upstream block whose servers are re-resolved through Docker's DNS."""
+    lines = [f"    upstream {name} {{", f"        zone {name} 64k;"]
+    if balance:
+        lines.append(f"        {balance};")
+    for server in servers:
+        lines.append(f"        server {server}:{port} resolve{' ' + server_params if server_params else ''};")
+    lines.append("    }")
+    return "\n".join(lines)
+
+
+# Directories that never hold templates but can be huge (dependencies, model stores, VCS)
+PRUNE_DIRS = {".git", "node_modules", "__pycache__", "huggingface", "ollama_models", "whisper_models", "bundle"}
+RENDER_MANIFEST = os.path.join(here, ".render_manifest.json")
+RENDERER_VERSION = "2"  # bump to re-render everything when substitution rules change
+
+
+def _prune_paths(env):
+    return {
+        os.path.abspath(getattr(env, name))
+        for name in ("go_installs_dir", "ollama_models_dir", "whisper_models_dir", "huggingface_dir")
+        if hasattr(env, name)
+    }
+
+
+def _template_files(currdir, env):
+    """Yield .template/.default/.copy files under currdir, skipping pruned directories."""
+    if not os.path.isdir(currdir):
+        yield currdir
+        return
+    pruned = _prune_paths(env)
+    for root, dirs, files in os.walk(currdir):
+        dirs[:] = [
+            d for d in dirs
+            if d not in PRUNE_DIRS and os.path.join(root, d) not in pruned
+        ]
+        for name in sorted(files):
+            if name.endswith((".template", ".default", ".copy")):
+                yield os.path.join(root, name)
+
+
+def _hash(data):
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
 
+def compile_substitutions(env_vars):
+    """
+    One regex matching $NAME for every env name. Alternatives are tried longest first,
+    so $KEYCLOAK_HOST is never consumed as a shorter name plus leftover text, while
+    $BRAND_NAME_synapse still resolves to $BRAND_NAME followed by "_synapse".
+    """
+    names = sorted((k for k in env_vars if not k.startswith("__")), key=len, reverse=True)
+    if not names:
+        return re.compile(r"(?!)")
+    return re.compile(r"\$(" + "|".join(map(re.escape, names)) + ")")
 
-def substitutions(currdir, env): 
-    if os.path.isdir(currdir):
-        try:
-            for file in os.listdir(currdir):
-                substitutions(os.path.join(currdir, file), env)
-        except:
-            print(f"Couldn't process {currdir}")
-    else:
-        if currdir.endswith(".template"):
-            print("Applying substitutions to " + currdir)
-            newFile = currdir.replace(".template","")
-            with open(currdir, 'r') as f:
+
+def _render(text, pattern, env_vars, referenced):
+    """Replace every $NAME in a single pass, noting which names occurred."""
+    def value(match):
+        k = match.group(1)
+        referenced.add(k)
+        return str(env_vars[k])
+
+    return pattern.sub(value, text)
+
+
+def _load_manifest(manifest_file):
+    try:
+        with open(manifest_file, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _up_to_date(entry, template_hash, env_vars, names_hash):
+    """A template needs no re-render if it, its variables and its output are unchanged."""
+    if not entry or entry["template"] != template_hash or entry["names"] != names_hash:
+        return False
+    for k, value_hash in entry["vars"].items():
+        if k not in env_vars or _hash(str(env_vars[k])) != value_hash:
+            return False
+    try:
+        with open(entry["output"], "r") as f:
+            return _hash(f.read()) == entry["output_hash"]
+    except OSError:
+        return False
+
+
+def substitutions(currdir, env, manifest_file=RENDER_MANIFEST):
+    """
+    Render the .template files under currdir (or the single file currdir) with env's values.
+    A manifest records each template's hash, the env variables it used and its output,
+    so only templates whose inputs changed are rendered again.
+    Returns the output files whose content changed.
+    """
+    # Only eagerly defined names, so the output doesn't depend on what was accessed before
+    lazy = getattr(env, "LAZY_ATTRIBUTES", {})
+    env_vars = {k: v for k, v in vars(env).items() if k not in lazy}
+    # Adding or removing a variable can change how any $NAME resolves
+    names_hash = _hash("\n".join([RENDERER_VERSION] + sorted(env_vars)))
+    manifest = _load_manifest(manifest_file)
+    pattern = compile_substitutions(env_vars)
+    changed = []
+
+    for path in _template_files(currdir, env):
+        if path.endswith(".template"):
+            with open(path, 'r') as f:
                 templateText = f.read()
-            for k, v in vars(env).items():
-                templateText = templateText.replace("$"+k, str(v))
-                newFile = newFile.replace("$"+k, str(v)) # also templetize the filename (!)
-            print(f"Writing to {newFile}")
-            with open(newFile, 'w+') as f:
-                f.write(templateText)
+            template_hash = _hash(templateText)
+            if _up_to_date(manifest.get(path), template_hash, env_vars, names_hash):
+                continue
+            print("Applying substitutions to " + path)
+            referenced = set()
+            newFile = _render(path.replace(".template", ""), pattern, env_vars, referenced)  # also templetize the filename (!)
+            templateText = _render(templateText, pattern, env_vars, referenced)
+            if write_if_changed(newFile, templateText):
+                print(f"Writing to {newFile}")
+                changed.append(newFile)
+            manifest[path] = dict(
+                template=template_hash,
+                names=names_hash,
+                vars={k: _hash(str(env_vars[k])) for k in sorted(referenced)},
+                output=newFile,
+                output_hash=_hash(templateText),
+            )
 
-        if currdir.endswith(".default"):
-            newFile = currdir.replace(".default","")
+        if path.endswith(".default"):
+            newFile = path.replace(".default", "")
             if os.path.exists(newFile):
-                return
-            print("Applying substitutions to " + currdir)
-            with open(currdir, 'r') as f:
+                continue
+            print("Applying substitutions to " + path)
+            with open(path, 'r') as f:
                 templateText = f.read()
-            for k, v in vars(env).items():
-                templateText = templateText.replace("$"+k, str(v))
-                newFile = newFile.replace("$"+k, str(v)) # also templetize the filename (!)
+            referenced = set()
+            templateText = _render(templateText, pattern, env_vars, referenced)
+            newFile = _render(newFile, pattern, env_vars, referenced)  # also templetize the filename (!)
             print(f"Writing to {newFile}")
-            with open(newFile, 'w+') as f:
-                f.write(templateText)
+            if write_if_changed(newFile, templateText):
+                changed.append(newFile)
 
-        if currdir.endswith(".copy"):
-            newFile = currdir.replace(".copy","")
+        if path.endswith(".copy"):
+            newFile = path.replace(".copy", "")
             if not os.path.exists(newFile):
-                print(f"Copying {currdir} to {newFile}")
-                shutil.copy(currdir, newFile)
+                print(f"Copying {path} to {newFile}")
+                shutil.copy(path, newFile)
+                changed.append(newFile)
+
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_file + ".tmp", manifest_file)
+    return changed
 
 def initializeFiles():
     # Check if we are in a GitHub Actions environment
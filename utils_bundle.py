@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from utils_docker import DOCKER_CLIENT
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+BUNDLE_DIR = os.path.join(here, "bundle")
+MANIFEST = "manifest.json"
+
+# Images run.py starts outside of env.py's container configs
+HELPER_IMAGES = ["postgres:15-alpine", "curlimages/curl:latest", "alpine:latest"]
+
+
+def _normalize(image):
+    """Add the implicit :latest tag so the same image isn't listed twice."""
+    if "@" in image or ":" in image.rsplit("/", 1)[-1]:
+        return image
+    return f"{image}:latest"
+
+
+def bundle_images(env, services=None):
+    """Every image needed to bring up the given services (default: SERVICES_TO_RUN)."""
+    images = [config["image"] for config in env.container_configs(services)]
+    images += HELPER_IMAGES
+    if env.USER_WEBSITE != "localhost":
+        images.append("certbot/certbot")
+    return sorted({_normalize(image) for image in images})
+
+
+def _ensure_image(image):
+    try:
+        return DOCKER_CLIENT.images.get(image)
+    except docker.errors.ImageNotFound:
+        print(f"Pulling {image}")
+        return DOCKER_CLIENT.images.pull(image)
+
+
+def group_by_layers(images):
+    """
+    Split images into groups that share no layers, so each group can be saved
+    (with its shared layers stored once) and loaded independently in parallel.
+    """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for image, layers in images.items():
+        parent.setdefault(image, image)
+        for layer in layers:
+            parent.setdefault(layer, layer)
+            parent[find(layer)] = find(image)
+
+    groups = {}
+    for image in images:
+        groups.setdefault(find(image), []).append(image)
+    return sorted(groups.values(), key=lambda group: group[0])
+
+
+def _require_zstd():
+    if shutil.which("zstd") is None:
+        raise RuntimeError("zstd is required to build or load image bundles")
+
+
+def bundle(env, bundle_dir=BUNDLE_DIR, services=None):
+    """docker save the stack's images into zstd-compressed, layer-deduplicated archives."""
+    _require_zstd()
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    layers = {}
+    for image in bundle_images(env, services):
+        layers[image] = _ensure_image(image).attrs["RootFS"].get("Layers", [])
+
+    groups = []
+    for i, images in enumerate(group_by_layers(layers)):
+        filename = f"images-{i:02d}.tar.zst"
+        path = os.path.join(bundle_dir, filename)
+        print(f"Saving {', '.join(images)} to {filename}")
+        save = subprocess.Popen(["docker", "save", *images], stdout=subprocess.PIPE)
+        compress = subprocess.run(
+            ["zstd", "-q", "-T0", "-f", "-o", path], stdin=save.stdout
+        )
+        save.stdout.close()
+        if save.wait() != 0 or compress.returncode != 0:
+            raise RuntimeError(f"Failed to save {', '.join(images)}")
+        groups.append(dict(file=filename, images=images, size=os.path.getsize(path)))
+
+    manifest = dict(
+        created=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        services=list(services or env.SERVICES_TO_RUN),
+        groups=groups,
+    )
+    with open(os.path.join(bundle_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    total = sum(group["size"] for group in groups)
+    print(f"Bundled {len(layers)} images in {len(groups)} archives ({total / 1024**3:.1f}GB)")
+    return manifest
+
+
+def _missing(images):
+    missing = []
+    for image in images:
+        try:
+            DOCKER_CLIENT.images.get(image)
+        except docker.errors.ImageNotFound:
+            missing.append(image)
+    return missing
+
+
+def _load_group(bundle_dir, group):
+    path = os.path.join(bundle_dir, group["file"])
+    decompress = subprocess.Popen(["zstd", "-q", "-dc", path], stdout=subprocess.PIPE)
+    load = subprocess.run(
+        ["docker", "load", "-q"], stdin=decompress.stdout, stdout=subprocess.PIPE, text=True
+    )
+    decompress.stdout.close()
+    if decompress.wait() != 0 or load.returncode != 0:
+        raise RuntimeError(f"Failed to load {group['file']}")
+    print(load.stdout.strip())
+
+
+def load(bundle_dir=BUNDLE_DIR, max_workers=4):
+    """Load a bundle's archives in parallel, skipping groups whose images are all present."""
+    manifest_path = os.path.join(bundle_dir, MANIFEST)
+    if not os.path.isfile(manifest_path):
+        print(f"No image bundle at {bundle_dir}")
+        return False
+    _require_zstd()
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    groups = [group for group in manifest["groups"] if _missing(group["images"])]
+    if not groups:
+        print("All bundled images are already loaded")
+        return True
+    print(f"Loading {len(groups)} image archives from {bundle_dir}")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(_load_group, bundle_dir, group) for group in groups]:
+            future.result()
+    return True
@@ -1,8 +1,12 @@
 import docker
+import hashlib
+import io
 import json
 import subprocess
 import os
+import tarfile
 import time
+import utils_logs
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Any, List, Type
 
@@ -70,19 +74,27 @@ def analyze_logs(
     try:
         container = DOCKER_CLIENT.containers.get(container_name)
 
-        # Get logs with timestamp
+        # Get logs with timestamp, straight from the json-file log when we can read it
         since = datetime.utcnow() - timedelta(minutes=time_range_minutes)
-        logs = container.logs(
-            since=since, until=datetime.utcnow(), timestamps=True, tail=max_lines
-        ).decode("utf-8")
+        until = datetime.utcnow()
+        lines = utils_logs.json_log_records(
+            container.attrs, since=since, until=until, max_lines=max_lines
+        )
+        if lines is None:
+            lines = (
+                container.logs(since=since, until=until, timestamps=True, tail=max_lines)
+                .decode("utf-8")
+                .split("\n")
+            )
 
         # Apply filters if specified
         if filters:
-            filtered_logs = []
-            for line in logs.split("\n"):
-                if all(value.lower() in line.lower() for value in filters.values()):
-                    filtered_logs.append(line)
-            logs = "\n".join(filtered_logs)
+            lines = (
+                line
+                for line in lines
+                if all(value.lower() in line.lower() for value in filters.values())
+            )
+        logs = "\n".join(lines)
 
         # Analyze logs
         analysis = self._extract_log_patterns(logs)
@@ -133,6 +145,17 @@ def ensure_network(network_name):
         print(f"Network {network_name} created.")
 
 
+def _run_args(config):
+    """containers.run kwargs for a config, turning its network aliases into an endpoint config."""
+    config = dict(config)
+    aliases = config.pop("aliases", None)
+    if aliases and config.get("network"):
+        config["networking_config"] = {
+            config["network"]: DOCKER_CLIENT.api.create_endpoint_config(aliases=aliases)
+        }
+    return config
+
+
 def debug_container(config):
     print(f'\033[4;32mDebugging container {config["name"]}\033[0m')
     container_name = config["name"]
@@ -165,7 +188,7 @@ def debug_container(config):
 
     # Now run it
     print("Starting container with debug configuration...")
-    DOCKER_CLIENT.containers.run(**config)
+    DOCKER_CLIENT.containers.run(**_run_args(config))
 
 
 def stop_container(container_name):
@@ -175,6 +198,41 @@ def stop_container(container_name):
     except:
         print("Couldn't stop container {container_name}. Maybe its not running")
 
+def containers_using(paths, configs):
+    """Container configs with a bind mount that is, or contains, one of paths."""
+    paths = [os.path.abspath(path) for path in paths]
+    using = []
+    for config in configs:
+        for source in config.get("volumes", {}):
+            if not os.path.isabs(source):
+                continue  # named volume
+            if any(path == source or path.startswith(source.rstrip("/") + "/") for path in paths):
+                using.append(config)
+                break
+    return using
+
+
+def restart_changed(paths, configs, skip=()):
+    """
+    Restart the running containers that mount any of the changed paths. Restarting also
+    re-resolves single-file bind mounts, which keep pointing at the old file once it's
+    been replaced by rename.
+    """
+    restarted = []
+    for config in containers_using(paths, configs):
+        if config.get("aliases", [config["name"]])[0] in skip:
+            continue
+        try:
+            container = DOCKER_CLIENT.containers.get(config["name"])
+        except NotFound:
+            continue
+        if container.status == "running":
+            print(f"Restarting {config['name']} for its changed configuration")
+            container.restart()
+            restarted.append(config["name"])
+    return restarted
+
+
 def run_container(config):
     print(f'\033[4;32mRunning container {config["name"]}\033[0m')
     container_name = config["name"]
@@ -197,7 +255,104 @@ def run_container(config):
         print(f"No container is running with name {container_name}")
     # Now run it
     print(f"Starting {container_name}")
-    return DOCKER_CLIENT.containers.run(**config)
+    return DOCKER_CLIENT.containers.run(**_run_args(config))
+
+
+# Keycloak options that are baked in by `kc.sh build` and must match at runtime
+KEYCLOAK_BUILD_OPTIONS = [
+    "KC_DB",
+    "KC_FEATURES",
+    "KC_FEATURES_DISABLED",
+    "KC_HEALTH_ENABLED",
+    "KC_METRICS_ENABLED",
+    "KC_HTTP_RELATIVE_PATH",
+    "KC_CACHE",
+    "KC_CACHE_STACK",
+]
+
+KEYCLOAK_DOCKERFILE = """FROM {base} AS builder
+{env_lines}
+COPY oauth_certs/ /opt/keycloak/oauth_certs/
+RUN cp "$(ls -d /usr/lib/jvm/*/lib/security/cacerts | head -n 1)" /opt/keycloak/cacerts && \\
+    chmod 644 /opt/keycloak/cacerts && \\
+    for cert in /opt/keycloak/oauth_certs/*.crt; do \\
+        [ -f "$cert" ] || continue; \\
+        keytool -import -trustcacerts -keystore /opt/keycloak/cacerts -storepass changeit \\
+            -noprompt -alias "$(basename "$cert" .crt)" -file "$cert"; \\
+    done
+RUN /opt/keycloak/bin/kc.sh build
+
+FROM {base}
+COPY --from=builder /opt/keycloak/ /opt/keycloak/
+"""
+
+
+def build_keycloak_image(config, oauth_certs_dir):
+    """
+    Build (or reuse) a Keycloak image that has already run `kc.sh build` and has the
+    OAuth certificates baked into its truststore. The tag is a hash of the base image's
+    ID, the build-time options and the certificates, so any change produces a new image.
+    """
+    base = config["image"]
+    build_env = {
+        k: str(v) for k, v in config["environment"].items() if k in KEYCLOAK_BUILD_OPTIONS
+    }
+    dockerfile = KEYCLOAK_DOCKERFILE.format(
+        base=base,
+        env_lines="\n".join(f'ENV {k}="{v}"' for k, v in sorted(build_env.items())),
+    )
+
+    certs = {}
+    if os.path.isdir(oauth_certs_dir):
+        for cert in sorted(os.listdir(oauth_certs_dir)):
+            if cert.endswith(".crt"):
+                with open(os.path.join(oauth_certs_dir, cert), "rb") as f:
+                    certs[cert] = f.read()
+
+    # The base tag isn't pinned, so a re-pulled base must produce a new image too
+    try:
+        base_id = DOCKER_CLIENT.images.get(base).id
+    except NotFound:
+        base_id = DOCKER_CLIENT.images.pull(base).id
+
+    key = hashlib.sha256(dockerfile.encode())
+    key.update(base_id.encode())
+    for cert, data in certs.items():
+        key.update(cert.encode())
+        key.update(hashlib.sha256(data).digest())
+    # Named after the short name so replicas and density-mode deployments share the image
+    name = config.get("aliases", [config["name"]])[0]
+    tag = f"{name}-optimized:{key.hexdigest()[:12]}"
+
+    try:
+        DOCKER_CLIENT.images.get(tag)
+        print(f"Using cached optimized Keycloak image {tag}")
+        return tag
+    except NotFound:
+        pass
+
+    print(f"Building optimized Keycloak image {tag}")
+    context = io.BytesIO()
+    with tarfile.open(fileobj=context, mode="w") as tar:
+        files = {"Dockerfile": dockerfile.encode()}
+        files.update({f"oauth_certs/{cert}": data for cert, data in certs.items()})
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    context.seek(0)
+    DOCKER_CLIENT.images.build(fileobj=context, custom_context=True, tag=tag, rm=True)
+    return tag
+
+
+def use_optimized_keycloak(config, oauth_certs_dir):
+    """Point a Keycloak container config at the pre-built image and start it with --optimized."""
+    try:
+        config["image"] = build_keycloak_image(config, oauth_certs_dir)
+        config["environment"]["KC_OPTIMIZED"] = "true"
+    except (APIError, docker.errors.BuildError) as e:
+        print(f"Couldn't build optimized Keycloak image, starting unoptimized: {e}")
+    return config
 
 
 def wait_for_db(network, db_url, db_user="postgres", max_attempts=30, delay=2):
@@ -273,11 +428,12 @@ def wait_for_db_localhost(db_port=5432, db_user="postgres", max_attempts=30, del
             
 def wait_for_url(url, network):
     # Create and start the container
-    stop_container("url_test")
+    # Helper containers are named per network so deployments can start side by side
+    stop_container(f"url_test_{network}")
     run_container(
         dict(
             image="curlimages/curl:latest",  # Use the curl-specific image
-            name="url_test",
+            name=f"url_test_{network}",
             network=network,
             #network_mode="host",  # Set the network mode to host
             environment={"TEST_URL": url},
@@ -382,7 +538,7 @@ def model_exists(model_name, network):
     result = run_container(
         dict(
             image="curlimages/curl",
-            name="ModelPull",
+            name=f"ModelPull_{network}",
             command=[
                 "curl",
                 "-s",
@@ -424,7 +580,7 @@ def pullModels(models_to_pull, network):
             run_container(
                 dict(
                     image="curlimages/curl",
-                    name="ModelPull",
+                    name=f"ModelPull_{network}",
                     command=[
                         "curl",
                         "-X",
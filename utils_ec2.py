@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+# Point EC2_METADATA_URL at a local stand-in to test without EC2
+IMDS_URL = os.getenv("EC2_METADATA_URL", "http://169.254.169.254")
+CACHE_FILE = os.path.join(here, "ec2_metadata.json")
+TOKEN_TTL_SECONDS = 21600
+
+# The only metadata the deployment looks at
+METADATA_KEYS = [
+    "instance-id",
+    "instance-type",
+    "placement/region",
+    "placement/availability-zone",
+    "local-ipv4",
+    "public-ipv4",
+    "public-hostname",
+]
+
+
+async def _request(base_url, method, path, headers=None, connect_timeout=0.2, timeout=1.0):
+    """Minimal HTTP/1.1 request, returning (status, body)."""
+    url = urlsplit(base_url)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(url.hostname, url.port or 80), connect_timeout
+    )
+    try:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {url.netloc}", "Connection: close"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, body.decode(errors="replace")
+
+
+async def fetch_metadata(base_url=IMDS_URL, keys=METADATA_KEYS, cached=None, connect_timeout=0.2, timeout=1.0):
+    """
+    Fetch instance metadata over IMDSv2: one token PUT, then the instance ID, then any
+    keys the cached entry for that instance doesn't have, concurrently. Returns None
+    when the metadata service isn't reachable.
+    """
+    request = lambda method, path, headers: _request(
+        base_url, method, path, headers, connect_timeout=connect_timeout, timeout=timeout
+    )
+    try:
+        status, token = await request(
+            "PUT",
+            "/latest/api/token",
+            {"X-aws-ec2-metadata-token-ttl-seconds": TOKEN_TTL_SECONDS, "Content-Length": 0},
+        )
+        if status != 200:
+            return None
+        headers = {"X-aws-ec2-metadata-token": token}
+        status, instance_id = await request("GET", "/latest/meta-data/instance-id", headers)
+        if status != 200:
+            return None
+
+        metadata = dict((cached or {}).get(instance_id, {}))
+        metadata["instance-id"] = instance_id
+        missing = [key for key in keys if key not in metadata]
+        responses = await asyncio.gather(
+            *(request("GET", f"/latest/meta-data/{key}", headers) for key in missing)
+        )
+        for key, (status, value) in zip(missing, responses):
+            # Keys like public-ipv4 404 on instances that don't have one
+            metadata[key] = value if status == 200 else None
+        return metadata
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        return None
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def load_metadata(base_url=IMDS_URL, keys=METADATA_KEYS, cache_file=CACHE_FILE):
+    """
+    EC2 metadata for this instance, or None when not on EC2. Results are cached per
+    instance ID, so a restarted or re-imaged instance is picked up but repeat runs on
+    the same instance cost only the token and instance-id requests.
+    """
+    cache = _load_cache(cache_file)
+    fetch = lambda: asyncio.run(fetch_metadata(base_url, keys, cached=cache))
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        metadata = fetch()
+    else:
+        # Called from async code (e.g. the server importing env): use a thread's own loop
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            metadata = pool.submit(fetch).result()
+    if metadata is None:
+        return None
+    cache[metadata["instance-id"]] = metadata
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(cache_file + ".tmp", cache_file)
+    return metadata
+
+
+if __name__ == "__main__":
+    base_url = sys.argv[1] if len(sys.argv) > 1 else IMDS_URL
+    print(json.dumps(load_metadata(base_url), indent=2))
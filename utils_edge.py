@@ -0,0 +1,166 @@
+import json
+import os
+
+from docker.errors import NotFound
+
+import util
+from utils_docker import DOCKER_CLIENT, ensure_network, run_container
+
+# One edge nginx per host owns ports 80/443/8448 and passes each connection through
+# to the deployment whose hostnames match (SNI for TLS, Host for plain HTTP). TLS is
+# still terminated by each deployment's own nginx.
+EDGE_NAME = "devsecops_edge"
+EDGE_NETWORK = "devsecops_edge"
+TLS_PORTS = [443, 8448]
+# The config directory is mounted rather than the file: a file bind mount keeps
+# pointing at the old inode once the config is replaced by rename
+EDGE_CONF_DIR = "/etc/nginx/edge"
+EDGE_CONF = EDGE_CONF_DIR + "/nginx.conf"
+
+EDGE_CONFIG = """worker_processes auto;
+
+events {{
+    worker_connections 4096;
+}}
+
+http {{
+    resolver 127.0.0.11 valid=10s;
+
+    map $host $tenant {{
+        hostnames;
+        default "";
+{http_map}
+    }}
+
+    server {{
+        listen 80 default_server;
+        location / {{
+            if ($tenant = "") {{
+                return 421;
+            }}
+            proxy_pass http://$tenant:80;
+            proxy_set_header Host $host;
+            proxy_set_header X-Real-IP $remote_addr;
+            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        }}
+    }}
+}}
+
+stream {{
+    resolver 127.0.0.11 valid=10s;
+
+    map $ssl_preread_server_name $tenant {{
+        hostnames;
+        default "";
+{stream_map}
+    }}
+{stream_servers}
+}}
+"""
+
+
+def _edge_dir(env):
+    return os.path.join(env.SHARED_ASSETS_DIR, "edge")
+
+
+def tenant_hosts(env):
+    """Hostnames served by this deployment, as nginx map wildcards."""
+    return sorted({f".{env.USER_WEBSITE}", f".{env.BACKEND_LOCATION}"})
+
+
+def load_registry(env):
+    path = os.path.join(_edge_dir(env), "tenants.json")
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def register_tenant(env):
+    """
+    Record this deployment's nginx and hostnames in the host-wide tenant registry.
+    Raises ValueError if another deployment already serves any of the hostnames: nginx
+    rejects duplicate map keys, so the edge couldn't start or reload.
+    """
+    registry = load_registry(env)
+    hosts = tenant_hosts(env)
+    for distinguisher, tenant in registry.items():
+        clash = set(hosts) & set(tenant["hosts"])
+        if distinguisher != env.distinguisher and clash:
+            raise ValueError(
+                f"Hostnames {sorted(clash)} are already routed to deployment {distinguisher!r}; "
+                "give each density deployment its own USER_WEBSITE and BACKEND_LOCATION"
+            )
+    registry[env.distinguisher] = dict(upstream=env.nginx["name"], hosts=hosts)
+
+    os.makedirs(_edge_dir(env), exist_ok=True)
+    path = os.path.join(_edge_dir(env), "tenants.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    return registry
+
+
+def render_config(registry):
+    http_map, stream_map = [], []
+    for distinguisher, tenant in sorted(registry.items()):
+        for host in tenant["hosts"]:
+            http_map.append(f"        {host} {tenant['upstream']};")
+            stream_map.append(f"        {host} {tenant['upstream']};")
+    stream_servers = "\n".join(
+        f"""
+    server {{
+        listen {port};
+        ssl_preread on;
+        proxy_pass $tenant:{port};
+    }}"""
+        for port in TLS_PORTS
+    )
+    return EDGE_CONFIG.format(
+        http_map="\n".join(http_map),
+        stream_map="\n".join(stream_map),
+        stream_servers=stream_servers,
+    )
+
+
+def ensure_edge(env):
+    """Register this deployment, then start or reload the shared edge nginx."""
+    registry = register_tenant(env)
+    config_path = os.path.join(_edge_dir(env), "nginx.conf")
+    util.write_if_changed(config_path, render_config(registry))
+
+    ensure_network(EDGE_NETWORK)
+    network = DOCKER_CLIENT.networks.get(EDGE_NETWORK)
+    tenant_nginx = DOCKER_CLIENT.containers.get(env.nginx["name"])
+    if EDGE_NETWORK not in tenant_nginx.attrs["NetworkSettings"]["Networks"]:
+        network.connect(tenant_nginx)
+
+    try:
+        edge = DOCKER_CLIENT.containers.get(EDGE_NAME)
+        mounts = {mount["Destination"] for mount in edge.attrs.get("Mounts", [])}
+        if EDGE_CONF_DIR not in mounts:
+            print(f"Recreating {EDGE_NAME} to mount its config directory")
+            edge.remove(force=True)
+        elif edge.status == "running":
+            print(f"Reloading {EDGE_NAME} with {len(registry)} deployments")
+            for command in (["nginx", "-t", "-c", EDGE_CONF], ["nginx", "-s", "reload", "-c", EDGE_CONF]):
+                result = edge.exec_run(command)
+                if result.exit_code != 0:
+                    raise RuntimeError(
+                        f"{' '.join(command)} failed in {EDGE_NAME}:\n{result.output.decode(errors='replace')}"
+                    )
+            return edge
+    except NotFound:
+        pass
+    return run_container(
+        dict(
+            image="nginx:latest",
+            name=EDGE_NAME,
+            command=["nginx", "-c", EDGE_CONF, "-g", "daemon off;"],
+            detach=True,
+            network=EDGE_NETWORK,
+            restart_policy={"Name": "always"},
+            volumes={_edge_dir(env): {"bind": EDGE_CONF_DIR, "mode": "ro"}},
+            ports={"80/tcp": 80, **{f"{port}/tcp": port for port in TLS_PORTS}},
+        )
+    )
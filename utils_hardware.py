@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+import re
+import subprocess
+import sys
+
+NVIDIA_QUERY = [
+    "nvidia-smi",
+    "--query-gpu=index,uuid,name,memory.total",
+    "--format=csv,noheader,nounits",
+]
+ROCM_QUERY = ["rocm-smi", "--showuniqueid", "--showproductname", "--showmeminfo", "vram", "--json"]
+
+# How the GPU services share the host's GPUs. "dedicated" services get a GPU of their
+# own while at least one is left for the "shared" services, which split the rest.
+DEFAULT_PLACEMENT = {
+    "sglang": "dedicated",
+    "ollama": "shared",
+    "deepseek_janus": "shared",
+}
+
+
+def _run(command):
+    try:
+        return subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return None
+
+
+def parse_nvidia_smi(output):
+    """Parse `nvidia-smi --query-gpu=index,uuid,name,memory.total --format=csv,noheader,nounits`."""
+    gpus = []
+    for row in csv.reader(io.StringIO(output)):
+        if len(row) < 4:
+            continue
+        index, uuid, name, memory = (field.strip() for field in row[:4])
+        gpus.append(
+            dict(vendor="nvidia", index=int(index), uuid=uuid, name=name, memory_mb=int(float(memory)))
+        )
+    return gpus
+
+
+def parse_rocm_smi(output):
+    """Parse `rocm-smi --showuniqueid --showproductname --showmeminfo vram --json`."""
+    gpus = []
+    for card, info in sorted(json.loads(output).items()):
+        match = re.fullmatch(r"card(\d+)", card)
+        if not match:
+            continue
+        memory = info.get("VRAM Total Memory (B)", 0)
+        gpus.append(
+            dict(
+                vendor="amd",
+                index=int(match.group(1)),
+                uuid=info.get("Unique ID", ""),
+                name=info.get("Card series", info.get("Card SKU", "")),
+                memory_mb=int(memory) // (1024 * 1024),
+            )
+        )
+    return gpus
+
+
+def query_gpus(run=_run):
+    """Every GPU on this host. Pass run to replay recorded nvidia-smi/rocm-smi output."""
+    gpus = []
+    nvidia = run(NVIDIA_QUERY)
+    if nvidia:
+        gpus += parse_nvidia_smi(nvidia)
+    rocm = run(ROCM_QUERY)
+    if rocm:
+        try:
+            gpus += parse_rocm_smi(rocm)
+        except (json.JSONDecodeError, AttributeError, ValueError):
+            print("Couldn't parse rocm-smi output")
+    return gpus
+
+
+def assign_gpus(gpus, placement=DEFAULT_PLACEMENT):
+    """Map each GPU service to the GPU indices it should see."""
+    order = sorted(gpus, key=lambda gpu: (-gpu["memory_mb"], gpu["index"]))
+    dedicated = [service for service, mode in placement.items() if mode == "dedicated"]
+    shared = [service for service, mode in placement.items() if mode == "shared"]
+
+    assignment = {}
+    for service in dedicated:
+        # largest GPUs first, but never leave the shared services without one
+        if len(order) > (1 if shared else 0):
+            assignment[service] = [order.pop(0)["index"]]
+    pool = sorted(gpu["index"] for gpu in (order or gpus))
+    for service in shared + [service for service in dedicated if service not in assignment]:
+        if pool:
+            assignment[service] = pool
+    return assignment
+
+
+def device_requests(gpus, indices):
+    """Docker DeviceRequests exposing exactly the given GPUs (by UUID where known)."""
+    from docker.types import DeviceRequest
+
+    by_vendor = {}
+    for gpu in gpus:
+        if gpu["index"] in indices:
+            by_vendor.setdefault(gpu["vendor"], []).append(gpu["uuid"] or str(gpu["index"]))
+    return [
+        DeviceRequest(device_ids=device_ids, capabilities=[["gpu"]], driver=vendor)
+        for vendor, device_ids in by_vendor.items()
+    ]
+
+
+if __name__ == "__main__":
+    # python utils_hardware.py [recorded-nvidia-smi.csv]
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r") as f:
+            recorded = f.read()
+        gpus = query_gpus(run=lambda command: recorded if command is NVIDIA_QUERY else None)
+    else:
+        gpus = query_gpus()
+    for gpu in gpus:
+        print(f"{gpu['vendor']} {gpu['index']}: {gpu['name']} {gpu['memory_mb']}MB {gpu['uuid']}")
+    print(json.dumps(assign_gpus(gpus), indent=2))
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from urllib.parse import quote, urlencode
+
+COLORS = [
+    "\033[32m",
+    "\033[33m",
+    "\033[34m",
+    "\033[35m",
+    "\033[36m",
+    "\033[92m",
+    "\033[93m",
+    "\033[94m",
+    "\033[95m",
+    "\033[96m",
+]
+STDERR_COLOR = "\033[31m"
+RESET = "\033[0m"
+
+STDOUT, STDERR = 1, 2
+
+
+def docker_socket_path():
+    """Resolve the Docker socket the same way utils_docker does (DOCKER_HOST, then Colima)."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    colima_socket = os.path.expanduser("~/.colima/default/docker.sock")
+    if os.path.exists(colima_socket):
+        return colima_socket
+    return "/var/run/docker.sock"
+
+
+def parse_since(since):
+    """Turn '10m', '2h', '30s', '1d' or a unix timestamp into a unix timestamp."""
+    if since is None:
+        return None
+    match = re.fullmatch(r"(\d+)([smhd])", since)
+    if match:
+        seconds = int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return int(time.time()) - seconds
+    return int(float(since))
+
+
+class _Body:
+    """Reads an HTTP response body, undoing chunked transfer encoding if the daemon used it."""
+
+    def __init__(self, reader, chunked):
+        self.reader = reader
+        self.chunked = chunked
+        self.remaining = 0
+        self.done = False
+
+    async def _next_chunk(self):
+        size_line = await self.reader.readline()
+        if not size_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        self.remaining = int(size_line.split(b";")[0].strip() or b"0", 16)
+        if self.remaining == 0:
+            self.done = True
+            raise asyncio.IncompleteReadError(b"", None)
+
+    async def readexactly(self, n):
+        if not self.chunked:
+            return await self.reader.readexactly(n)
+        data = b""
+        while len(data) < n:
+            if self.done:
+                raise asyncio.IncompleteReadError(data, n)
+            if self.remaining == 0:
+                await self._next_chunk()
+            part = await self.reader.readexactly(min(n - len(data), self.remaining))
+            self.remaining -= len(part)
+            if self.remaining == 0:
+                await self.reader.readexactly(2)  # chunk trailer CRLF
+            data += part
+        return data
+
+    async def read(self, n):
+        if not self.chunked:
+            return await self.reader.read(n)
+        if self.done:
+            return b""
+        if self.remaining == 0:
+            try:
+                await self._next_chunk()
+            except asyncio.IncompleteReadError:
+                return b""
+        return await self.readexactly(min(n, self.remaining))
+
+
+async def _open_logs(container, since=None, tail=None):
+    """Open a following log stream for one container straight from the Docker API."""
+    reader, writer = await asyncio.open_unix_connection(docker_socket_path())
+    params = {"follow": 1, "stdout": 1, "stderr": 1}
+    if since is not None:
+        params["since"] = since
+    if tail is not None:
+        params["tail"] = tail
+    writer.write(
+        f"GET /containers/{quote(container)}/logs?{urlencode(params)} HTTP/1.1\r\n"
+        "Host: docker\r\n\r\n".encode()
+    )
+    await writer.drain()
+
+    status = (await reader.readline()).decode(errors="replace").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode(errors="replace").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    body = _Body(reader, headers.get("transfer-encoding", "").lower() == "chunked")
+    if len(status) < 2 or status[1] != "200":
+        message = (await body.read(4096)).decode(errors="replace").strip()
+        writer.close()
+        raise RuntimeError(message or " ".join(status).strip())
+    # TTY containers send a raw stream; everything else is multiplexed stdout/stderr frames
+    multiplexed = headers.get("content-type") != "application/vnd.docker.raw-stream"
+    return body, writer, multiplexed
+
+
+async def _follow(container, queue, wake, since=None, tail=None, pattern=None):
+    """Push (stream, line) pairs for one container onto its bounded queue."""
+    try:
+        body, writer, multiplexed = await _open_logs(container, since=since, tail=tail)
+    except (OSError, RuntimeError) as e:
+        await queue.put((STDERR, f"couldn't follow logs: {e}"))
+        await queue.put(None)
+        wake.set()
+        return
+
+    partial = {STDOUT: b"", STDERR: b""}
+
+    async def emit(stream, data):
+        lines = (partial[stream] + data).split(b"\n")
+        partial[stream] = lines.pop()
+        for line in lines:
+            text = line.decode(errors="replace").rstrip("\r")
+            if pattern is None or pattern.search(text):
+                # Blocks when the printer falls behind, which stops us reading the
+                # socket and pushes back on the daemon for this container only
+                await queue.put((stream, text))
+                wake.set()
+
+    try:
+        while True:
+            if multiplexed:
+                header = await body.readexactly(8)
+                stream = STDERR if header[0] == STDERR else STDOUT
+                (size,) = struct.unpack(">I", header[4:8])
+                await emit(stream, await body.readexactly(size))
+            else:
+                data = await body.read(65536)
+                if not data:
+                    break
+                await emit(STDOUT, data)
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+        for stream, rest in partial.items():
+            if rest:
+                await queue.put((stream, rest.decode(errors="replace")))
+        await queue.put(None)
+        wake.set()
+
+
+async def _print_logs(queues, wake, batch=64, out=sys.stdout):
+    """Round-robin over the per-container queues so a chatty service can't starve the rest."""
+    width = max(len(name) for name in queues)
+    prefixes = {
+        name: f"{COLORS[i % len(COLORS)]}{name:<{width}}{RESET} | "
+        for i, name in enumerate(queues)
+    }
+    active = dict(queues)
+    while active:
+        # clear before sweeping so a put that lands mid-sweep still wakes us
+        wake.clear()
+        progressed = False
+        for name, queue in list(active.items()):
+            for _ in range(batch):
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    del active[name]
+                    break
+                stream, line = item
+                marker = f"{STDERR_COLOR}!{RESET} " if stream == STDERR else ""
+                out.write(f"{prefixes[name]}{marker}{line}\n")
+                progressed = True
+        out.flush()
+        if active and not progressed:
+            await wake.wait()
+
+
+async def follow_logs(containers, since=None, tail=None, pattern=None, queue_size=1000):
+    """Follow several containers' logs from one event loop until they all exit."""
+    wake = asyncio.Event()
+    queues = {name: asyncio.Queue(maxsize=queue_size) for name in containers}
+    followers = [
+        asyncio.create_task(_follow(name, queue, wake, since=since, tail=tail, pattern=pattern))
+        for name, queue in queues.items()
+    ]
+    try:
+        await _print_logs(queues, wake)
+    finally:
+        for follower in followers:
+            follower.cancel()
+
+
+def _time_key(timestamp):
+    """Sortable key for an RFC3339Nano UTC timestamp; Go trims trailing zeros from the fraction."""
+    seconds, _, fraction = timestamp.rstrip(b"Z").partition(b".")
+    return seconds + b"." + fraction.ljust(9, b"0")
+
+
+def _datetime_key(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.").encode() + b"%06d000" % dt.microsecond
+
+
+def _record_key(mm, start, end):
+    # "time" is the last key the json-file driver writes, so look for it from the end
+    field = mm.rfind(b'"time":"', start, end)
+    if field == -1:
+        return b""
+    field += len(b'"time":"')
+    close = mm.find(b'"', field, end)
+    return _time_key(mm[field:close]) if close != -1 else b""
+
+
+def _line_start(mm, pos):
+    """Offset of the first line starting at or after pos."""
+    if pos == 0:
+        return 0
+    newline = mm.find(b"\n", pos - 1)
+    return len(mm) if newline == -1 else newline + 1
+
+
+def _seek(mm, key):
+    """Binary search for the first record whose timestamp is >= key."""
+    lo, hi = 0, len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = _line_start(mm, mid)
+        if start >= len(mm):
+            hi = mid
+            continue
+        end = mm.find(b"\n", start)
+        end = len(mm) if end == -1 else end
+        if _record_key(mm, start, end) < key:
+            lo = end + 1
+        else:
+            hi = mid
+    return _line_start(mm, lo)
+
+
+def _records(f, mm, start, end):
+    try:
+        while start < end:
+            newline = mm.find(b"\n", start, end)
+            stop = end if newline == -1 else newline
+            try:
+                record = json.loads(mm[start:stop])
+                yield f"{record['time']} {record['log'].rstrip(chr(10))}"
+            except (ValueError, KeyError):
+                pass  # a record the daemon is still writing
+            start = stop + 1
+    finally:
+        mm.close()
+        f.close()
+
+
+def json_log_records(container_attrs, since=None, until=None, max_lines=None):
+    """
+    Read a container's json-file log directly instead of through the Docker API.
+
+    Memory-maps the log, binary-searches to the since/until window (naive UTC
+    datetimes) and yields "timestamp log" lines like `docker logs --timestamps`,
+    keeping only the last max_lines. Returns None when the fast path can't be
+    used (another log driver, the file isn't readable from here, or the window
+    reaches into rotated files) so the caller can fall back to the API.
+    """
+    if container_attrs.get("HostConfig", {}).get("LogConfig", {}).get("Type") != "json-file":
+        return None
+    path = container_attrs.get("LogPath")
+    try:
+        f = open(path, "rb")
+    except (OSError, TypeError):
+        return None
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return None if os.path.exists(f"{path}.1") else iter(())
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    start = _seek(mm, _datetime_key(since)) if since is not None else 0
+    end = _seek(mm, _datetime_key(until)) if until is not None else len(mm)
+    if start == 0 and since is not None and os.path.exists(f"{path}.1"):
+        first_end = mm.find(b"\n")
+        if _record_key(mm, 0, len(mm) if first_end == -1 else first_end) > _datetime_key(since):
+            mm.close()
+            f.close()
+            return None
+
+    if max_lines is not None:
+        # walk back from the end of the window instead of parsing all of it
+        tail = end
+        for _ in range(max_lines):
+            if tail <= start:
+                break
+            newline = mm.rfind(b"\n", start, tail - 1)
+            tail = start if newline == -1 else newline + 1
+        start = max(start, tail)
+    return _records(f, mm, start, end)
+
+
+def main(argv, env):
+    parser = argparse.ArgumentParser(
+        prog="run.py logs", description="Follow logs from the stack's containers"
+    )
+    parser.add_argument(
+        "services",
+        nargs="*",
+        help="Services from SERVICES_TO_RUN or container names (default: all running services)",
+    )
+    parser.add_argument("--since", default="10m", help="Start from e.g. 30s, 10m, 2h or a unix timestamp")
+    parser.add_argument("--tail", default=None, help="Number of existing lines to show per container")
+    parser.add_argument("--grep", default=None, help="Only show lines matching this regex")
+    args = parser.parse_args(argv)
+
+    containers = []
+    for service in args.services or env.SERVICES_TO_RUN:
+        if service in env.SERVICE_CONTAINERS:
+            containers += [config["name"] for config in env.container_configs([service])]
+        elif args.services:
+            containers.append(service)
+    containers = list(dict.fromkeys(containers))
+    if not containers:
+        print("No containers to follow")
+        return
+
+    pattern = re.compile(args.grep) if args.grep else None
+    try:
+        asyncio.run(
+            follow_logs(containers, since=parse_since(args.since), tail=args.tail, pattern=pattern)
+        )
+    except KeyboardInterrupt:
+        pass
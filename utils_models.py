@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import requests
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+USAGE_FILE = os.path.join(here, "model_cache.json")
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
+OLLAMA_REGISTRY = "registry.ollama.ai"
+GB = 1024**3
+
+
+def _load_usage(usage_file=USAGE_FILE):
+    if os.path.isfile(usage_file):
+        try:
+            with open(usage_file, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print(f"Couldn't read {usage_file}, starting a fresh usage record")
+    return {}
+
+
+def _save_usage(usage, usage_file=USAGE_FILE):
+    tmp_file = usage_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(usage, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, usage_file)
+
+
+def _atime(path):
+    """Most recent access/modification time of a file or tree."""
+    latest = 0
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                latest = max(latest, st.st_atime, st.st_mtime)
+        return latest
+    try:
+        st = os.stat(path)
+        return max(st.st_atime, st.st_mtime)
+    except OSError:
+        return 0
+
+
+def _tree_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.isfile(path) else 0
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            # Hardlinked blobs (see dedupe_blobs) only take up space once
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def ollama_model_name(name):
+    """Normalize an Ollama model reference to namespace/model:tag form."""
+    if ":" not in name.split("/")[-1]:
+        name += ":latest"
+    if "/" not in name:
+        name = "library/" + name
+    return name
+
+
+def _ollama_inventory(models_dir):
+    manifests_dir = os.path.join(models_dir, "manifests", OLLAMA_REGISTRY)
+    blobs_dir = os.path.join(models_dir, "blobs")
+    models = []
+    if not os.path.isdir(manifests_dir):
+        return models
+
+    for root, _, files in os.walk(manifests_dir):
+        for tag in files:
+            manifest_path = os.path.join(root, tag)
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print(f"Skipping unreadable Ollama manifest {manifest_path}")
+                continue
+            layers = list(manifest.get("layers", []))
+            if manifest.get("config"):
+                layers.append(manifest["config"])
+            blobs = {
+                os.path.join(blobs_dir, layer["digest"].replace(":", "-")): layer.get("size", 0)
+                for layer in layers
+                if "digest" in layer
+            }
+            namespace_model = os.path.relpath(root, manifests_dir)
+            models.append(
+                dict(
+                    store="ollama",
+                    name=f"{namespace_model}:{tag}",
+                    path=manifest_path,
+                    blobs=blobs,
+                    last_used=_atime(manifest_path),
+                )
+            )
+    return models
+
+
+def _huggingface_inventory(hf_dir):
+    hub_dir = os.path.join(hf_dir, "hub")
+    models = []
+    if not os.path.isdir(hub_dir):
+        return models
+
+    for entry in sorted(os.listdir(hub_dir)):
+        repo_dir = os.path.join(hub_dir, entry)
+        if "--" not in entry or not os.path.isdir(repo_dir):
+            continue
+        # models--deepseek-ai--Janus-Pro-1B -> deepseek-ai/Janus-Pro-1B
+        name = "/".join(entry.split("--")[1:])
+        blobs_dir = os.path.join(repo_dir, "blobs")
+        blobs = {}
+        if os.path.isdir(blobs_dir):
+            for blob in os.listdir(blobs_dir):
+                blob_path = os.path.join(blobs_dir, blob)
+                blobs[blob_path] = os.path.getsize(blob_path)
+        models.append(
+            dict(
+                store="huggingface",
+                name=name,
+                path=repo_dir,
+                blobs=blobs,
+                # snapshots/ are symlinks into blobs/, so the blob atimes tell us
+                # when the model was last loaded
+                last_used=_atime(blobs_dir) or _atime(repo_dir),
+            )
+        )
+    return models
+
+
+def _whisper_inventory(whisper_dir):
+    models = []
+    if not os.path.isdir(whisper_dir):
+        return models
+    for entry in sorted(os.listdir(whisper_dir)):
+        path = os.path.join(whisper_dir, entry)
+        models.append(
+            dict(
+                store="whisper",
+                name=entry,
+                path=path,
+                blobs={path: _tree_size(path)},
+                last_used=_atime(path),
+            )
+        )
+    return models
+
+
+def record_usage(env, usage_file=USAGE_FILE):
+    """
+    Record last-use times for every cached model.
+
+    Models currently loaded by Ollama (/api/ps) are stamped with the current time.
+    Everything else keeps the newest of its recorded time and its file access time.
+    """
+    usage = _load_usage(usage_file)
+    now = time.time()
+
+    try:
+        response = requests.get(f"{OLLAMA_API_URL}/api/ps", timeout=2)
+        response.raise_for_status()
+        for model in response.json().get("models", []):
+            usage[f"ollama:{ollama_model_name(model['name'])}"] = now
+    except requests.RequestException:
+        print("Ollama API not reachable, using file access times only")
+
+    for model in inventory(env, usage=usage):
+        key = f"{model['store']}:{model['name']}"
+        usage[key] = max(usage.get(key, 0), model["last_used"])
+
+    _save_usage(usage, usage_file)
+    return usage
+
+
+def inventory(env, usage=None):
+    """List every model in the Ollama, whisper and Hugging Face stores."""
+    if usage is None:
+        usage = _load_usage()
+    models = (
+        _ollama_inventory(env.ollama_models_dir)
+        + _whisper_inventory(env.whisper_models_dir)
+        + _huggingface_inventory(env.huggingface_dir)
+    )
+    for model in models:
+        key = f"{model['store']}:{model['name']}"
+        model["last_used"] = max(model["last_used"], usage.get(key, 0))
+    return models
+
+
+def pinned_models(env):
+    """Models that must never be evicted: MODELS_TO_PULL, WHISPER_MODELS and the HF models our containers serve."""
+    pinned = {f"ollama:{ollama_model_name(m)}" for m in env.MODELS_TO_PULL}
+    pinned.update(f"whisper:{m}" for m in env.WHISPER_MODELS)
+    pinned.add(f"huggingface:{env.deepseek_janus['environment']['MODEL_NAME']}")
+    command = env.sglang.get("command", [])
+    if "--model-path" in command:
+        pinned.add(f"huggingface:{command[command.index('--model-path') + 1]}")
+    return pinned
+
+
+def _store_size(models):
+    sizes = {}
+    for model in models:
+        sizes.update(model["blobs"])
+    return sum(sizes.values())
+
+
+def _remove_model(model, remaining):
+    """Delete a model, keeping any Ollama blobs still referenced by the remaining models."""
+    print(f"Evicting {model['store']} model {model['name']}")
+    if model["store"] == "ollama":
+        still_used = set()
+        for other in remaining:
+            still_used.update(other["blobs"])
+        os.remove(model["path"])
+        for blob in model["blobs"]:
+            if blob not in still_used and os.path.exists(blob):
+                os.remove(blob)
+    elif os.path.isdir(model["path"]):
+        shutil.rmtree(model["path"])
+    else:
+        os.remove(model["path"])
+
+
+def evict(env, budget_bytes=None, min_free_bytes=None, dry_run=False):
+    """
+    Evict least-recently-used, unpinned models until the stores fit the budget
+    and the disk holding them has at least min_free_bytes free.
+    """
+    usage = record_usage(env)
+    models = inventory(env, usage=usage)
+    pinned = pinned_models(env)
+    candidates = sorted(
+        (m for m in models if f"{m['store']}:{m['name']}" not in pinned),
+        key=lambda m: m["last_used"],
+    )
+
+    def over_budget():
+        if budget_bytes is not None and _store_size(models) > budget_bytes:
+            return True
+        if min_free_bytes is not None:
+            os.makedirs(env.ollama_models_dir, exist_ok=True)
+            if shutil.disk_usage(env.ollama_models_dir).free < min_free_bytes:
+                return True
+        return False
+
+    evicted = []
+    while candidates and over_budget():
+        model = candidates.pop(0)
+        models.remove(model)
+        if dry_run:
+            print(f"Would evict {model['store']} model {model['name']}")
+        else:
+            try:
+                _remove_model(model, models)
+            except OSError as e:
+                print(f"Couldn't evict {model['name']}: {e}")
+                continue
+            usage.pop(f"{model['store']}:{model['name']}", None)
+        evicted.append(model["name"])
+
+    if over_budget():
+        print("Model stores are still over budget; remaining models are pinned or in use")
+    if not dry_run:
+        _save_usage(usage)
+    return evicted
+
+
+def _sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedupe_blobs(env, min_size=1024 * 1024):
+    """
+    Replace identical files across the whisper and Hugging Face stores with hardlinks.
+    Ollama blobs are already content-addressed in a single directory.
+    Returns the number of bytes reclaimed.
+    """
+    by_size = {}
+    for root_dir in (env.whisper_models_dir, env.huggingface_dir):
+        for root, _, files in os.walk(root_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    continue
+                st = os.stat(path)
+                if st.st_size >= min_size:
+                    by_size.setdefault(st.st_size, []).append((path, st))
+
+    reclaimed = 0
+    for size, files in by_size.items():
+        if len(files) < 2:
+            continue
+        by_hash = {}
+        for path, st in files:
+            by_hash.setdefault(_sha256(path), []).append((path, st))
+        for paths in by_hash.values():
+            keep, keep_st = paths[0]
+            for path, st in paths[1:]:
+                if (st.st_dev, st.st_ino) == (keep_st.st_dev, keep_st.st_ino):
+                    continue
+                if st.st_dev != keep_st.st_dev:
+                    continue
+                tmp_path = path + ".dedupe"
+                os.link(keep, tmp_path)
+                os.replace(tmp_path, path)
+                print(f"Linked {path} -> {keep}")
+                reclaimed += size
+    return reclaimed
+
+
+def enforce_budget(env):
+    """Dedupe and evict ahead of a model pull so the pull doesn't run out of disk."""
+    budget = env.MODEL_CACHE_BUDGET_GB
+    min_free = env.MODEL_CACHE_MIN_FREE_GB
+    reclaimed = dedupe_blobs(env)
+    if reclaimed:
+        print(f"Reclaimed {reclaimed / GB:.1f}GB by deduplicating model blobs")
+    evict(
+        env,
+        budget_bytes=budget * GB if budget is not None else None,
+        min_free_bytes=min_free * GB if min_free is not None else None,
+    )
+
+
+if __name__ == "__main__":
+    import env
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "inventory"
+    if command == "inventory":
+        usage = record_usage(env)
+        pinned = pinned_models(env)
+        for model in sorted(inventory(env, usage=usage), key=lambda m: m["last_used"]):
+            last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(model["last_used"]))
+            pin = "\tpinned" if f"{model['store']}:{model['name']}" in pinned else ""
+            print(
+                f"{model['store']}\t{model['name']}\t"
+                f"{_store_size([model]) / GB:.2f}GB\t{last_used}{pin}"
+            )
+    elif command == "evict":
+        enforce_budget(env)
+    elif command == "dedupe":
+        print(f"Reclaimed {dedupe_blobs(env) / GB:.1f}GB")
+    else:
+        print("Usage: python utils_models.py [inventory|evict|dedupe]")
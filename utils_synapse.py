@@ -0,0 +1,409 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import util
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+# Host/container paths for the generated worker configuration
+WORKERS_DIR = os.path.join(here, "synapse", "workers")
+WORKERS_DATA_DIR = "/data/workers"
+
+REDIS_HOST = "synapse_redis"
+REPLICATION_PORT = 9093
+GENERIC_WORKER_PORT = 8083
+MEDIA_WORKER_PORT = 8085
+FEDERATION_SENDER = "synapse_federation_sender"
+MEDIA_WORKER = "synapse_media_worker"
+
+# Client endpoints served from the sync pool. Sync requests from one user are
+# pinned to one worker so its caches stay warm.
+SYNC_PATHS = [
+    r"^/_matrix/client/(r0|v3)/sync$",
+    r"^/_matrix/client/(api/v1|r0|v3)/events$",
+    r"^/_matrix/client/(api/v1|r0|v3)/initialSync$",
+    r"^/_matrix/client/(api/v1|r0|v3)/rooms/[^/]+/initialSync$",
+]
+
+# Client endpoints that send events or read room state
+CLIENT_PATHS = [
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/rooms/.*/(send|state|redact|join|invite|leave|ban|unban|kick)",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/rooms/.*/(messages|members|context|event|relations|threads|joined_members)",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/join/",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/profile/",
+    r"^/_matrix/client/(r0|v3|unstable)/keys/(query|changes|claim)$",
+    r"^/_matrix/client/(r0|v3|unstable)/publicRooms$",
+    r"^/_matrix/federation/v1/(send|event|state|state_ids|backfill|get_missing_events|publicRooms|query)/",
+]
+
+MEDIA_PATHS = [
+    r"^/_matrix/media/",
+    r"^/_matrix/client/v1/media/",
+    r"^/_matrix/federation/v1/media/",
+]
+
+
+def generic_worker_names(count):
+    return [f"synapse_generic_worker{i}" for i in range(1, count + 1)]
+
+
+def worker_pools(count):
+    """Split the generic workers into a sync pool and an event-sending pool."""
+    names = generic_worker_names(count)
+    if count < 2:
+        return names, names
+    split = (count + 1) // 2
+    return names[:split], names[split:]
+
+
+def worker_command(app, worker_name=None):
+    """Arguments for the synapse image's start.py to run one process with the shared config."""
+    extra = "main.yaml" if worker_name is None else f"{worker_name}.yaml"
+    return [
+        "run",
+        "-m",
+        app,
+        "--config-path=/data/homeserver.yaml",
+        f"--config-path={WORKERS_DATA_DIR}/shared.yaml",
+        f"--config-path={WORKERS_DATA_DIR}/{extra}",
+    ]
+
+
+def _worker_yaml(name, app, port=None, resources=()):
+    text = (
+        f"worker_app: {app}\n"
+        f"worker_name: {name}\n"
+        f"worker_log_config: {WORKERS_DATA_DIR}/log.config\n"
+    )
+    if port is not None:
+        text += (
+            "worker_listeners:\n"
+            "  - type: http\n"
+            f"    port: {port}\n"
+            "    x_forwarded: true\n"
+            "    resources:\n"
+            f"      - names: [{', '.join(resources)}]\n"
+        )
+    return text
+
+
+def write_worker_configs(env):
+    """
+    Write the shared, main-process and per-worker Synapse configs into synapse/workers,
+    leaving unchanged files alone and removing those of workers no longer configured.
+    Returns the paths that changed.
+    """
+    if not env.SYNAPSE_WORKERS:
+        if os.path.isdir(WORKERS_DIR):
+            shutil.rmtree(WORKERS_DIR)
+        return []
+
+    os.makedirs(WORKERS_DIR, exist_ok=True)
+    files = {
+        "shared.yaml": (
+            "# Generated by utils_synapse.py - loaded by the main process and every worker\n"
+            "redis:\n"
+            "  enabled: true\n"
+            f"  host: {REDIS_HOST}\n"
+            "  port: 6379\n"
+            "instance_map:\n"
+            "  main:\n"
+            "    host: synapse\n"
+            f"    port: {REPLICATION_PORT}\n"
+            "federation_sender_instances:\n"
+            f"  - {FEDERATION_SENDER}\n"
+            f"media_instance_running_background_jobs: {MEDIA_WORKER}\n"
+        ),
+        "main.yaml": (
+            "# Generated by utils_synapse.py - main process only\n"
+            "enable_media_repo: false\n"
+            "listeners:\n"
+            "  - port: 8008\n"
+            "    tls: false\n"
+            "    type: http\n"
+            "    x_forwarded: true\n"
+            "    resources:\n"
+            "      - names: [client, federation]\n"
+            "        compress: false\n"
+            "  - port: 9000\n"
+            "    type: metrics\n"
+            "    bind_addresses: ['0.0.0.0']\n"
+            f"  - port: {REPLICATION_PORT}\n"
+            "    tls: false\n"
+            "    type: http\n"
+            "    resources:\n"
+            "      - names: [replication]\n"
+        ),
+        # Workers log to stdout so `docker logs` shows them separately
+        "log.config": (
+            "version: 1\n"
+            "formatters:\n"
+            "  precise:\n"
+            "    format: '%(asctime)s - %(name)s - %(lineno)d - %(levelname)s - %(request)s - %(message)s'\n"
+            "handlers:\n"
+            "  console:\n"
+            "    class: logging.StreamHandler\n"
+            "    formatter: precise\n"
+            "root:\n"
+            "  level: INFO\n"
+            "  handlers: [console]\n"
+            "disable_existing_loggers: false\n"
+        ),
+        f"{FEDERATION_SENDER}.yaml": _worker_yaml(
+            FEDERATION_SENDER, "synapse.app.generic_worker"
+        ),
+        f"{MEDIA_WORKER}.yaml": _worker_yaml(
+            MEDIA_WORKER, "synapse.app.media_repository", MEDIA_WORKER_PORT, ["media"]
+        ),
+    }
+    for name in generic_worker_names(env.SYNAPSE_WORKERS):
+        files[f"{name}.yaml"] = _worker_yaml(
+            name, "synapse.app.generic_worker", GENERIC_WORKER_PORT, ["client", "federation"]
+        )
+
+    changed = []
+    for filename, text in files.items():
+        path = os.path.join(WORKERS_DIR, filename)
+        if util.write_if_changed(path, text):
+            changed.append(path)
+    for filename in os.listdir(WORKERS_DIR):
+        if filename not in files:
+            path = os.path.join(WORKERS_DIR, filename)
+            os.remove(path)
+            changed.append(path)
+    if changed:
+        print(f"Updated {len(changed)} Synapse worker configs in {WORKERS_DIR}")
+    return changed
+
+
+def nginx_upstreams(count):
+    """nginx upstream blocks for the worker pools (http context)."""
+    if not count:
+        return ""
+    sync_pool, client_pool = worker_pools(count)
+    return "\n\n".join(
+        [
+            "# Synapse worker pools - generated from SYNAPSE_WORKERS by utils_synapse.py",
+            util.nginx_upstream(
+                "synapse_sync",
+                sync_pool,
+                GENERIC_WORKER_PORT,
+                balance="hash $http_authorization consistent",
+            ),
+            util.nginx_upstream(
+                "synapse_client", client_pool, GENERIC_WORKER_PORT, balance="least_conn"
+            ),
+            util.nginx_upstream("synapse_media", [MEDIA_WORKER], MEDIA_WORKER_PORT),
+        ]
+    )
+
+
+def nginx_locations(count):
+    """nginx location blocks routing worker-handled paths (synapse server context)."""
+    if not count:
+        return ""
+
+    def location(pattern, upstream):
+        return "\n".join(
+            [
+                f"        location ~ {pattern} {{",
+                f"            proxy_pass http://{upstream};",
+                "            proxy_set_header Host $host;",
+                "            proxy_set_header X-Real-IP $remote_addr;",
+                "            proxy_set_header X-Forwarded-Proto $scheme;",
+                "            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;",
+                "            proxy_http_version 1.1;",
+                "            proxy_buffering off;",
+                "            client_max_body_size 50M;",
+                "        }",
+            ]
+        )
+
+    blocks = ["# Synapse worker routes - generated from SYNAPSE_WORKERS by utils_synapse.py"]
+    blocks += [location(p, "synapse_sync") for p in SYNC_PATHS]
+    blocks += [location(p, "synapse_client") for p in CLIENT_PATHS]
+    blocks += [location(p, "synapse_media") for p in MEDIA_PATHS]
+    return "\n\n".join(blocks)
+
+
+# Caches that hold room state; these are the ones that thrash on hosts with many rooms
+STATE_CACHES = [
+    "get_users_in_room",
+    "get_current_state_ids",
+    "get_rooms_for_user",
+    "stateGroupCache",
+    "stateGroupMembersCache",
+]
+GB = 1024**3
+# Database facts from the last run that reached synapsedb, so tuning doesn't change
+# (and restart Synapse) just because the database isn't up yet
+DB_FACTS_FILE = os.path.join(here, "synapse", "db_facts.json")
+
+
+def host_memory_bytes():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def _psql(query, container="synapsedb", database="synapse"):
+    """Run a query in the Synapse database container, returning None if it isn't reachable."""
+    try:
+        result = subprocess.run(
+            ["docker", "exec", container, "psql", "-U", "postgres", "-d", database, "-tAc", query],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def compute_tuning(memory_bytes, max_connections=None, room_count=0, processes=1):
+    """
+    Derive Synapse cache factors and DB pool bounds.
+
+    The global cache factor grows with RAM (0.5 per 4GB, capped at 4), state caches get an
+    extra multiplier for hosts with many rooms, and the Postgres connection budget (less a
+    reserve for admin/tools) is split evenly between the main process and its workers.
+    """
+    global_factor = min(4.0, max(0.5, round(memory_bytes / GB / 8, 1)))
+    state_scale = min(4.0, 1 + room_count / 1000)
+    state_factor = round(global_factor * state_scale, 1)
+
+    tuning = dict(
+        SYNAPSE_CACHE_GLOBAL_FACTOR=global_factor,
+        SYNAPSE_PER_CACHE_FACTORS=json.dumps({name: state_factor for name in STATE_CACHES}),
+        # Never below Synapse's own 10K default, however small the host
+        SYNAPSE_EVENT_CACHE_SIZE=f"{max(10, int(10 * global_factor * state_scale))}K",
+    )
+    if max_connections:
+        per_process = (max_connections - 20) // max(1, processes)
+        # Never more than the budget allows, even if that's a small pool
+        cp_max = max(1, min(50, per_process))
+        tuning["SYNAPSE_CP_MAX"] = cp_max
+        tuning["SYNAPSE_CP_MIN"] = max(1, min(5, cp_max // 2))
+    return tuning
+
+
+def _db_facts(container):
+    """max_connections and room count from the database, or as last seen if it isn't running."""
+    max_connections = _psql("SHOW max_connections", container=container)
+    room_count = _psql("SELECT count(*) FROM rooms", container=container)
+    if max_connections is None:
+        try:
+            with open(DB_FACTS_FILE, "r") as f:
+                facts = json.load(f)
+            return facts.get("max_connections"), facts.get("room_count")
+        except (OSError, json.JSONDecodeError):
+            return None, None
+    os.makedirs(os.path.dirname(DB_FACTS_FILE), exist_ok=True)
+    with open(DB_FACTS_FILE, "w") as f:
+        json.dump(dict(max_connections=max_connections, room_count=room_count), f)
+    return max_connections, room_count
+
+
+def tune_synapse(env):
+    """Set the SYNAPSE_* cache and pool values on env from this host and the database."""
+    max_connections, room_count = _db_facts(env.synapsedb["name"])
+    processes = 1
+    if env.SYNAPSE_WORKERS:
+        processes += len(generic_worker_names(env.SYNAPSE_WORKERS)) + 2
+
+    tuning = compute_tuning(
+        host_memory_bytes(),
+        max_connections=int(max_connections) if max_connections else None,
+        room_count=int(room_count) if room_count and room_count.isdigit() else 0,
+        processes=processes,
+    )
+    for k, v in tuning.items():
+        setattr(env, k, v)
+    print(f"Synapse tuning: {tuning}")
+    return tuning
+
+
+def parse_cache_metrics(text):
+    """Collect per-cache hits, requests, size, max size and size evictions from Prometheus text."""
+    caches = {}
+    fields = {
+        "synapse_util_caches_cache_hits": "hits",
+        "synapse_util_caches_cache": "requests",
+        "synapse_util_caches_cache_size": "size",
+        "synapse_util_caches_cache_max_size": "max_size",
+        "synapse_util_caches_cache_evicted_size": "evicted",
+    }
+    for line in text.splitlines():
+        match = re.match(r"^(\w+)\{([^}]*)\}\s+(\S+)", line)
+        if not match or match.group(1) not in fields:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        if "name" not in labels:
+            continue
+        if fields[match.group(1)] == "evicted" and labels.get("reason") != "size":
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        cache = caches.setdefault(labels["name"], {})
+        key = fields[match.group(1)]
+        cache[key] = cache.get(key, 0) + value
+    return caches
+
+
+def suggest_cache_changes(caches, global_factor, per_cache_factors=None, min_requests=1000):
+    """Suggest bigger factors for full caches with poor hit rates that are evicting on size."""
+    per_cache_factors = per_cache_factors or {}
+    suggestions = {}
+    for name, stats in sorted(caches.items()):
+        requests = stats.get("requests", 0)
+        if requests < min_requests or not stats.get("max_size"):
+            continue
+        hit_rate = stats.get("hits", 0) / requests
+        full = stats.get("size", 0) >= 0.95 * stats["max_size"]
+        if hit_rate < 0.9 and full and stats.get("evicted", 0) > 0:
+            current = per_cache_factors.get(name, global_factor)
+            suggestions[name] = dict(
+                hit_rate=round(hit_rate, 3),
+                current_factor=current,
+                suggested_factor=round(min(current * 2, 16), 1),
+            )
+    return suggestions
+
+
+def fetch_metrics(container="synapse", port=9000):
+    result = subprocess.run(
+        ["docker", "exec", container, "curl", "-sf", f"http://localhost:{port}/_synapse/metrics"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout
+
+
+if __name__ == "__main__":
+    import env
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "suggest"
+    if command == "tune":
+        tune_synapse(env)
+    elif command == "suggest":
+        # Compare against the factors run.py actually renders, not the untuned defaults
+        tune_synapse(env)
+        suggestions = suggest_cache_changes(
+            parse_cache_metrics(fetch_metrics(env.synapse["name"])),
+            env.SYNAPSE_CACHE_GLOBAL_FACTOR,
+            json.loads(env.SYNAPSE_PER_CACHE_FACTORS),
+        )
+        if not suggestions:
+            print("No cache changes suggested")
+        for name, suggestion in suggestions.items():
+            print(
+                f"{name}: hit rate {suggestion['hit_rate']:.1%}, "
+                f"factor {suggestion['current_factor']} -> {suggestion['suggested_factor']}"
+            )
+    else:
+        print("Usage: python utils_synapse.py [tune|suggest]")